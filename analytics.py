@@ -0,0 +1,131 @@
+# Appointment analytics over precomputed rollups.
+# appt_daily_counts (day, doctor) and appt_hourly_counts (day, hour, doctor) are bumped in the
+# same transaction as every appointment insert (appt_create and bulk imports call record), so a
+# dashboard query sums at most one row per doctor per day (or hour) in the range and never scans
+# appointments. Days and hours are naive UTC, like date_time. Specialties are joined at query time.
+#
+#     python analytics.py --rebuild    # recompute both tables from appointments (backfill)
+import sys
+from collections import Counter
+from datetime import timedelta
+from sqlalchemy import select, delete, insert, update, func, extract, cast, text, Date
+from sqlalchemy.dialects import sqlite, postgresql
+from models import Appointment, Doctor, AppointmentDailyCount, AppointmentHourlyCount
+from http_cache import bump_versions
+
+MAX_RANGE_DAYS = 366
+NO_DOCTOR = 0  # rollup key for appointments without a doctor (primary keys cannot be NULL)
+
+def record(db, appointment_ids):
+    """Count freshly inserted (flushed, uncommitted) appointments into the rollups."""
+    daily, hourly = Counter(), Counter()
+    ids = list(appointment_ids)
+    for i in range(0, len(ids), 500):
+        rows = db.execute(select(Appointment.doctor_id, Appointment.date_time)
+                          .where(Appointment.id.in_(ids[i:i + 500])))
+        for doctor_id, dt in rows:
+            if dt is None:
+                continue
+            doc = doctor_id or NO_DOCTOR
+            daily[(dt.date(), doc)] += 1
+            hourly[(dt.date(), dt.hour, doc)] += 1
+    _add(db, AppointmentDailyCount.__table__, ("day", "doctor_id"), daily)
+    _add(db, AppointmentHourlyCount.__table__, ("day", "hour", "doctor_id"), hourly)
+
+def _add(db, table, keys, counts):
+    if not counts:
+        return
+    rows = [dict(zip(keys, k), count=n) for k, n in counts.items()]
+    dialect = db.bind.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        ins = (sqlite.insert if dialect == "sqlite" else postgresql.insert)(table)
+        db.execute(ins.on_conflict_do_update(index_elements=list(keys),
+                                             set_={"count": table.c.count + ins.excluded.count}), rows)
+        return
+    for r in rows:  # no upsert construct: bump the bucket, create it if it is new
+        hit = db.execute(update(table).where(*(table.c[k] == r[k] for k in keys))
+                         .values(count=table.c.count + r["count"]))
+        if hit.rowcount == 0:
+            db.execute(insert(table).values(**r))
+
+def rebuild(engine):
+    """Recompute both rollups from appointments in one transaction (idempotent).
+
+    Bumps the appointments version in the same transaction, so cached dashboards revalidate.
+    """
+    dt = Appointment.date_time
+    day = func.date(dt) if engine.dialect.name == "sqlite" else cast(dt, Date)
+    doc = func.coalesce(Appointment.doctor_id, NO_DOCTOR)
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            # hold off concurrent bookings so none is counted twice or missed
+            conn.execute(text("LOCK TABLE appointments IN SHARE MODE"))
+        conn.execute(delete(AppointmentDailyCount))
+        conn.execute(delete(AppointmentHourlyCount))
+        conn.execute(insert(AppointmentDailyCount).from_select(
+            ["day", "doctor_id", "count"],
+            select(day, doc, func.count()).where(dt.isnot(None)).group_by(day, doc)))
+        hour = extract("hour", dt)
+        conn.execute(insert(AppointmentHourlyCount).from_select(
+            ["day", "hour", "doctor_id", "count"],
+            select(day, hour, doc, func.count()).where(dt.isnot(None)).group_by(day, hour, doc)))
+        bump_versions(conn, "appointments")
+
+def _sort_key(k):
+    return (k is None, k if k is not None else 0)
+
+def appointment_stats(db, start, end, interval="day", by="specialty", doctor_id=None, specialty=None):
+    """Counts for the inclusive date range [start, end], per day or ISO week, per doctor or specialty."""
+    if interval not in ("day", "week"):
+        raise ValueError("interval must be 'day' or 'week'")
+    if by not in ("doctor", "specialty"):
+        raise ValueError("by must be 'doctor' or 'specialty'")
+    if end < start:
+        raise ValueError("to must not be before from")
+    if (end - start).days >= MAX_RANGE_DAYS:
+        raise ValueError(f"range is limited to {MAX_RANGE_DAYS} days")
+
+    def scoped(q, model):
+        q = q.outerjoin(Doctor, Doctor.id == model.doctor_id).where(model.day.between(start, end))
+        if doctor_id is not None:
+            q = q.where(model.doctor_id == doctor_id)
+        if specialty:
+            q = q.where(Doctor.specialty == specialty)
+        return q
+
+    D, H = AppointmentDailyCount, AppointmentHourlyCount
+    key = D.doctor_id if by == "doctor" else Doctor.specialty
+    series, totals = Counter(), Counter()
+    for day, k, n in db.execute(scoped(select(D.day, key, func.sum(D.count)), D).group_by(D.day, key)):
+        if by == "doctor" and k == NO_DOCTOR:
+            k = None
+        period = day if interval == "day" else day - timedelta(days=day.weekday())
+        series[(period, k)] += n
+        totals[k] += n
+    hours = db.execute(scoped(select(H.hour, func.sum(H.count)), H)
+                       .group_by(H.hour).order_by(func.sum(H.count).desc(), H.hour)).all()
+
+    field = "doctor_id" if by == "doctor" else "specialty"
+    ranked = sorted(totals.items(), key=lambda kv: (-kv[1], _sort_key(kv[0])))
+    out_totals = [{field: k, "count": n} for k, n in ranked]
+    if by == "doctor":
+        names = dict(db.execute(select(Doctor.id, Doctor.full_name)
+                                .where(Doctor.id.in_([k for k in totals if k is not None]))).all())
+        for t in out_totals:
+            t["full_name"] = names.get(t["doctor_id"])
+    return {
+        "from": start.isoformat(), "to": end.isoformat(), "interval": interval, "by": by,
+        "total": sum(totals.values()),
+        "series": [{"period": p.isoformat(), field: k, "count": n}
+                   for (p, k), n in sorted(series.items(), key=lambda kv: (kv[0][0], _sort_key(kv[0][1])))],
+        "totals": out_totals,
+        "busiest_hours": [{"hour": h, "count": n} for h, n in hours],
+    }
+
+if __name__ == "__main__":
+    from db import engine, check_engine
+    if sys.argv[1:] != ["--rebuild"]:
+        sys.exit("usage: python analytics.py --rebuild")
+    check_engine()
+    rebuild(engine)
+    print("appointment rollups rebuilt")
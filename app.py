@@ -1,62 +1,370 @@
-import os, io, uuid, json
-from functools import wraps
-from datetime import timedelta
-from flask import Flask, jsonify, request, Response, redirect, make_response
-from PIL import Image
-import boto3
+import os, uuid, json, time, math, ipaddress, tempfile
+from functools import wraps, lru_cache
+from datetime import timedelta, datetime
+from sqlalchemy.orm import joinedload
+from flask import Flask, Request, g, jsonify, request, Response, redirect, make_response, stream_with_context, send_file
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
 
-from db import Base, engine, SessionLocal
-from models import Patient, Doctor, Appointment
+from db import SessionLocal, check_engine
+from models import Patient, Doctor, Appointment, PhotoJob, DoctorHours, StaffUser
+from presign_cache import PresignCache
+from photo_jobs import PhotoPipeline, QueueFull, VARIANTS, CONTENT_TYPES, image_formats
+from storage import LocalStorage, make_storage
+from http_cache import ResponseCache, bump_versions, table_version, make_etag
+from precompressed import PrecompressedPage
+from bulk import iter_rows, bulk_import
+from timeutil import parse_dt
+from scheduling import SlotTaken, parse_hours, hours_json, availability, reserve_slot
+import search
+import migrate
+import analytics
+from auth import SessionStore, same_secret
+from ratelimit import RateLimiter, InFlight, parse_rule
+import metrics
 
 load_dotenv()
 
 # ---------------- App & config ----------------
+BULK_MAX_BYTES = int(os.getenv("BULK_MAX_BYTES", str(200 * 1024 * 1024)))
+BULK_BATCH     = int(os.getenv("BULK_BATCH_SIZE", "1000"))
+
+class HospitalRequest(Request):
+    @property
+    def max_content_length(self):
+        # bulk imports stream large bodies; everything else keeps the 5MB cap
+        if self.path.endswith("/bulk"):
+            return BULK_MAX_BYTES
+        return super().max_content_length
+
 app = Flask(__name__)
+app.request_class = HospitalRequest
+metrics.instrument_app(app)
 app.config["MAX_CONTENT_LENGTH"] = 5 * 1024 * 1024  # 5MB uploads
 app.config["PREFERRED_URL_SCHEME"] = "https"
-Base.metadata.create_all(bind=engine)
+# behind Nginx set TRUSTED_PROXY_HOPS=1 so rate limits see the client's address, not the proxy's
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+if TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
+check_engine()
+# DDL lives in migrate.py and runs once per deploy; workers only confirm the schema is current
+migrate.require_current()
 
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "s3")  # "s3" | "local"
 AWS_REGION   = os.getenv("AWS_REGION", "eu-north-1")
 S3_BUCKET    = os.getenv("S3_BUCKET")
+PHOTO_DIR    = os.getenv("PHOTO_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "photos"))
 PHOTO_TTL    = int(os.getenv("PHOTO_URL_TTL_SECONDS", "604800"))  # 7d
 PORT         = int(os.getenv("PORT", "8000"))
 
 ADMIN_TOKEN  = os.getenv("ADMIN_TOKEN", "")
 ADMIN_USER   = os.getenv("ADMIN_USER", "")
 ADMIN_PASS   = os.getenv("ADMIN_PASSWORD", "")
+SESSION_TTL  = int(os.getenv("SESSION_TTL_SECONDS", str(7 * 86400)))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+PAGE_LIMIT   = int(os.getenv("PAGE_LIMIT_DEFAULT", "50"))
+PAGE_MAX     = int(os.getenv("PAGE_LIMIT_MAX", "200"))
+STREAM_BATCH = int(os.getenv("STREAM_BATCH_SIZE", "500"))
+LIST_MAX_AGE = int(os.getenv("LIST_CACHE_MAX_AGE", "0"))  # seconds clients may reuse a list without revalidating
+PAGE_MAX_AGE = int(os.getenv("PAGE_CACHE_MAX_AGE", "86400"))  # /login and /console shells
+SITE_DIRECTORY_LIMIT = int(os.getenv("SITE_DIRECTORY_LIMIT", "100"))
+
+# token buckets as "<count>/<s|m|h>[,<burst>]"; "off" disables a rule
+RATE_LIMITS = {
+    "public":        os.getenv("RATE_LIMIT_PUBLIC", "10/s,30"),       # list/schedule reads, per client
+    "site":          os.getenv("RATE_LIMIT_SITE", "2/s,10"),          # /site, per client
+    "login":         os.getenv("RATE_LIMIT_LOGIN", "10/m,10"),        # login attempts, per client
+    "login_account": os.getenv("RATE_LIMIT_LOGIN_ACCOUNT", "5/m,5"),  # login attempts, per email
+}
+SHED_MAX_INFLIGHT = int(os.getenv("SHED_MAX_INFLIGHT", "0"))  # per worker; above it anonymous requests get 503 (0 = off)
 
 HOSPITAL     = os.getenv("HOSPITAL_NAME", "Cynthia Health Institute")
 FOUNDER      = os.getenv("FOUNDER_NAME", "Cynthia Udie")
 
-s3 = boto3.client("s3", region_name=AWS_REGION)
+storage = make_storage(
+    STORAGE_BACKEND, bucket=S3_BUCKET, region=AWS_REGION,
+    root=PHOTO_DIR, secret=os.getenv("MEDIA_SIGNING_KEY") or ADMIN_TOKEN,
+    # one connection per request thread plus the photo upload threads
+    max_connections=int(os.getenv("S3_MAX_POOL_CONNECTIONS", "0"))
+    or int(os.getenv("WEB_THREADS", "8")) + int(os.getenv("PHOTO_THREADS", "4")),
+)
+# reuse signed URLs for a fraction of their lifetime (default half of PHOTO_TTL)
+presign_cache = PresignCache(
+    maxsize=int(os.getenv("PRESIGN_CACHE_SIZE", "10000")),
+    max_age=PHOTO_TTL * float(os.getenv("PRESIGN_CACHE_FRACTION", "0.5")),
+    shared_url=os.getenv("PRESIGN_CACHE_REDIS_URL") or None,
+)
+response_cache = ResponseCache(maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", "256")))
+sessions = SessionStore(
+    SessionLocal, ttl_seconds=SESSION_TTL,
+    cache_size=int(os.getenv("SESSION_CACHE_SIZE", "10000")),
+    cache_seconds=int(os.getenv("SESSION_CACHE_SECONDS", "30")),
+)
+limiter = RateLimiter(
+    {name: parse_rule(spec) for name, spec in RATE_LIMITS.items()},
+    shared_url=os.getenv("RATE_LIMIT_REDIS_URL") or None,
+)
+inflight = InFlight()
 ALLOWED = {"png", "jpg", "jpeg", "webp"}
+PHOTO_MODELS = {"patients": Patient, "doctors": Doctor}
+_cores = os.cpu_count() or 1
+photo_pipeline = PhotoPipeline(
+    # per Gunicorn worker: split the cores between WEB_CONCURRENCY workers instead of each taking all of them
+    processes=int(os.getenv("PHOTO_PROCESSES", "0")) or max(1, _cores // int(os.getenv("WEB_CONCURRENCY", str(_cores)))),
+    threads=int(os.getenv("PHOTO_THREADS", "4")),
+    # per worker; above it uploads get 503 instead of piling up behind the encoders
+    max_pending=int(os.getenv("PHOTO_QUEUE_MAX", "32")),
+    spool_dir=os.getenv("PHOTO_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "hospital-photo-spool")),
+)
+# queued/processing jobs older than this belonged to a worker that died; they are marked failed
+PHOTO_JOB_STALE = int(os.getenv("PHOTO_JOB_STALE_SECONDS", "900"))
 
 # ---------------- Helpers ----------------
+def _sign_get(key: str):
+    with metrics.timed(metrics.STORAGE_LATENCY, metrics.STORAGE_ERRORS, backend=STORAGE_BACKEND, op="presign"):
+        return storage.url(key, PHOTO_TTL)
+
 def presigned_get(key: str):
-    if not key or not S3_BUCKET:
+    if not key or (STORAGE_BACKEND == "s3" and not S3_BUCKET):
         return None
-    return s3.generate_presigned_url(
-        "get_object",
-        Params={"Bucket": S3_BUCKET, "Key": key},
-        ExpiresIn=PHOTO_TTL
-    )
+    metrics.PHOTO_URL_LOOKUPS.inc()
+    return presign_cache.get(key, _sign_get)
+
+def variant_key(key: str, size: str = "full", fmt: str = "jpg") -> str:
+    """Derive a variant's key from photo_key (".../photo-<hex>/full.jpg").
 
-def save_photo_to_s3(file_storage, prefix: str, entity_id: int) -> str:
-    raw = file_storage.read()
+    Photos uploaded before variants existed only have their single JPEG, so they map to themselves.
+    """
+    if not key or not key.endswith("/full.jpg"):
+        return key
+    return f"{key[:-len('full.jpg')]}{size}.{fmt}"
+
+def save_photo_to_s3(raw: bytes, prefix: str, entity_id: int) -> str:
+    """Encode all variants and upload them side by side; returns the full-size JPEG key (photo_key)."""
     if not raw:
         raise ValueError("Empty file")
-    img = Image.open(io.BytesIO(raw)).convert("RGB")
-    img.thumbnail((1024, 1024))
-    out = io.BytesIO()
-    img.save(out, format="JPEG", quality=90, optimize=True)
-    out.seek(0)
-    key = f"{prefix}/{entity_id}/photo-{uuid.uuid4().hex}.jpg"
-    s3.put_object(
-        Bucket=S3_BUCKET, Key=key, Body=out,
-        ContentType="image/jpeg", CacheControl="max-age=31536000, public"
-    )
-    return key
+    with metrics.timed(metrics.IMAGE_ENCODE):
+        variants = photo_pipeline.encode(raw)
+    base = f"{prefix}/{entity_id}/photo-{uuid.uuid4().hex}/"
+    for name, body in variants.items():
+        with metrics.timed(metrics.STORAGE_LATENCY, metrics.STORAGE_ERRORS, backend=STORAGE_BACKEND, op="put"):
+            storage.put(base + name, body, CONTENT_TYPES[name.rsplit(".", 1)[1]])
+    return base + "full.jpg"
+
+def run_photo_job(job_id: str):
+    """Background half of a photo upload: encode the spooled file, store, then point the entity at the new key."""
+    with SessionLocal() as db:
+        job = db.get(PhotoJob, job_id)
+        job.status = "processing"; db.commit()
+        try:
+            with open(photo_pipeline.spool_path(job_id), "rb") as f:
+                raw = f.read()
+            photo_pipeline.unspool(job_id)
+            key = save_photo_to_s3(raw, job.kind, job.entity_id)
+            ent = db.get(PHOTO_MODELS[job.kind], job.entity_id)
+            if ent is None:
+                raise LookupError("entity was deleted")
+            ent.photo_key = key
+            bump_versions(db, job.kind)
+            job.photo_key, job.status = key, "done"
+        except Exception as e:
+            db.rollback()
+            job = db.get(PhotoJob, job_id)
+            job.status, job.error = "failed", str(e)[:500] or e.__class__.__name__
+        job.finished_at = datetime.utcnow()
+        db.commit()
+
+def fail_stale_photo_jobs():
+    """Mark jobs stuck in queued/processing past PHOTO_JOB_STALE as failed (their worker is gone)."""
+    cutoff = datetime.utcnow() - timedelta(seconds=PHOTO_JOB_STALE)
+    with SessionLocal() as db:
+        stale = db.query(PhotoJob).filter(PhotoJob.status.in_(("queued", "processing")),
+                                          PhotoJob.created_at < cutoff).all()
+        for job in stale:
+            job.status, job.error, job.finished_at = "failed", "interrupted: worker restarted", datetime.utcnow()
+            photo_pipeline.unspool(job.id)
+        db.commit()
+    return len(stale)
+
+# on startup (once in the Gunicorn master when preloading): nothing can still be working on old jobs
+fail_stale_photo_jobs()
+
+def job_json(job):
+    return {
+        "job_id": job.id, "kind": job.kind, "id": job.entity_id, "status": job.status,
+        "photo_url": photo_url(job.photo_key) if job.status == "done" else None,
+        "error": job.error,
+    }
+
+def queue_photo_upload(kind: str, label: str):
+    """Validate a multipart photo upload, record a job and hand it to the pipeline (202)."""
+    eid = request.form.get("id")
+    file = request.files.get("file")
+    if not eid or not file:
+        return jsonify({"error":"id and file required"}), 400
+    ext = file.filename.rsplit(".",1)[-1].lower() if "." in file.filename else ""
+    if ext not in ALLOWED:
+        return jsonify({"error":"allowed: jpg,jpeg,png,webp"}), 400
+    if photo_pipeline.max_pending and photo_pipeline.pending >= photo_pipeline.max_pending:
+        return _photo_queue_full()
+    with SessionLocal() as db:
+        ent = db.get(PHOTO_MODELS[kind], int(eid))
+        if not ent: return jsonify({"error":f"{label} not found"}), 404
+        job = PhotoJob(id=uuid.uuid4().hex, kind=kind, entity_id=ent.id, status="queued")
+        # the upload waits on disk, not in worker memory
+        if not photo_pipeline.spool(job.id, file.stream):
+            photo_pipeline.unspool(job.id)
+            return jsonify({"error":"Empty file"}), 400
+        db.add(job); db.commit()
+        try:
+            photo_pipeline.submit(run_photo_job, job.id)
+        except QueueFull:  # filled up since the check above
+            job.status, job.error, job.finished_at = "failed", "queue full", datetime.utcnow()
+            db.commit()
+            photo_pipeline.unspool(job.id)
+            return _photo_queue_full()
+        resp = jsonify({"job_id": job.id, "id": ent.id, "status": "queued",
+                        "status_url": f"/photos/jobs/{job.id}"})
+        return resp, 202, {"Location": f"/photos/jobs/{job.id}"}
+
+def _photo_queue_full():
+    metrics.REQUESTS_REJECTED.labels(reason="photo_queue").inc()
+    resp = jsonify({"error": "photo queue full, retry later"})
+    resp.status_code = 503
+    resp.headers["Retry-After"] = "5"
+    return resp
+
+def _page_args():
+    """Parse ?limit=&after= for keyset pagination on id. Raises ValueError."""
+    try:
+        limit = int(request.args.get("limit") or PAGE_LIMIT)
+        after = int(request.args.get("after") or 0)
+    except ValueError:
+        raise ValueError("limit and after must be integers")
+    return max(1, min(limit, PAGE_MAX)), after
+
+def _int_arg(name):
+    v = request.args.get(name)
+    if v in (None, ""):
+        return None
+    try:
+        return int(v)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+
+def _dt_arg(name):
+    v = request.args.get(name)
+    if v in (None, ""):
+        return None
+    return parse_dt(v, name)
+
+def keyset_page(db, model, filters, limit, after, options=()):
+    """One page ordered by id; fetches limit+1 rows to know if there is a next page."""
+    q = db.query(model).options(*options).filter(*filters)
+    if after:
+        q = q.filter(model.id > after)
+    rows = q.order_by(model.id).limit(limit + 1).all()
+    next_cursor = str(rows[limit - 1].id) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def wants_ndjson():
+    if request.args.get("format") == "ndjson":
+        return True
+    best = request.accept_mimetypes.best_match(["application/json", "application/x-ndjson"])
+    return best == "application/x-ndjson"
+
+def ndjson_stream(model, filters, to_json, after=0, options=()):
+    """Stream every matching row as NDJSON; rows are fetched and flushed in batches of STREAM_BATCH."""
+    def gen():
+        with SessionLocal() as db:
+            q = db.query(model).options(*options).filter(*filters)
+            if after:
+                q = q.filter(model.id > after)
+            buf = []
+            for row in q.order_by(model.id).yield_per(STREAM_BATCH):
+                buf.append(json.dumps(to_json(row)))
+                if len(buf) >= STREAM_BATCH:
+                    yield "\n".join(buf) + "\n"
+                    buf = []
+            if buf:
+                yield "\n".join(buf) + "\n"
+    return Response(stream_with_context(gen()), mimetype="application/x-ndjson")
+
+def photo_url(key, size=None, fmt=None):
+    """Presigned URL for a photo variant; defaults come from ?size=thumb|card|full and ?image_format=jpg|webp|avif."""
+    size = size or request.args.get("size", "full")
+    fmt = fmt or request.args.get("image_format", "jpg")
+    if size not in VARIANTS: size = "full"
+    if fmt != "jpg" and fmt not in image_formats(): fmt = "jpg"  # jpg needs no codec probe
+    return presigned_get(variant_key(key, size, fmt))
+
+def patient_json(p, **photo):
+    return {"id": p.id, "full_name": p.full_name, "phone": p.phone,
+            "photo_url": photo_url(p.photo_key, **photo)}
+
+def doctor_json(d, **photo):
+    return {"id": d.id, "full_name": d.full_name, "specialty": d.specialty,
+            "photo_url": photo_url(d.photo_key, **photo)}
+
+def appt_json(a, expand=()):
+    out = {
+        "id": a.id, "patient_id": a.patient_id, "doctor_id": a.doctor_id,
+        "date_time": a.date_time.isoformat() if getattr(a, "date_time", None) else None,
+        "end_time": a.end_time.isoformat() if getattr(a, "end_time", None) else None,
+        "reason": a.reason
+    }
+    if "patient" in expand:
+        out["patient"] = patient_json(a.patient) if a.patient else None
+    if "doctor" in expand:
+        out["doctor"] = doctor_json(a.doctor) if a.doctor else None
+    return out
+
+APPT_EXPANDS = {"patient": Appointment.patient, "doctor": Appointment.doctor}
+
+def _expand_arg():
+    """?expand=patient,doctor -> (names, loader options). Many-to-one joins keep it to one query per page."""
+    names = {n.strip() for n in request.args.get("expand", "").split(",") if n.strip()}
+    unknown = names - APPT_EXPANDS.keys()
+    if unknown:
+        raise ValueError(f"cannot expand {', '.join(sorted(unknown))}; allowed: patient, doctor")
+    return names, [joinedload(APPT_EXPANDS[n]) for n in sorted(names)]
+
+def cached_list(table, expand_tables=None):
+    """Conditional-GET + response cache for a JSON list route backed by `table`.
+
+    The ETag covers the table's version counter, the query string and the presign
+    window (so cached bodies never outlive their photo URLs). `expand_tables` maps
+    ?expand= names to the tables they embed; their version counters join the ETag
+    when requested. A matching If-None-Match is answered with 304 before any query runs.
+    """
+    def deco(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if wants_ndjson():
+                return f(*args, **kwargs)
+            expand = {n.strip() for n in request.args.get("expand", "").split(",")}
+            tables = [table] + sorted({t for n, t in (expand_tables or {}).items() if n in expand})
+            with SessionLocal() as db:
+                vers = [table_version(db, t) for t in tables]
+            window = int(time.time() // max(1, presign_cache.max_age))
+            etag = make_etag(*tables, *vers, window, request.query_string.decode())
+            if request.if_none_match.contains(etag):
+                resp = Response(status=304)
+            else:
+                body = response_cache.get(etag)
+                if body is None:
+                    rv = f(*args, **kwargs)
+                    if isinstance(rv, tuple):  # error responses are not cached
+                        return rv
+                    body = rv.get_data()
+                    response_cache.put(etag, body)
+                resp = Response(body, mimetype="application/json")
+            resp.set_etag(etag)
+            resp.headers["Cache-Control"] = f"public, max-age={LIST_MAX_AGE}, must-revalidate"
+            return resp
+        return wrapper
+    return deco
 
 def _extract_token():
     # Header
@@ -73,39 +381,134 @@ def _extract_token():
         return q.strip()
     return ""
 
+def current_principal():
+    """{"user_id", "email"} for a valid staff session or the ADMIN_TOKEN service token, else None."""
+    tok = _extract_token()
+    if not tok:
+        return None
+    if ADMIN_TOKEN and same_secret(tok, ADMIN_TOKEN):
+        return {"user_id": None, "email": ADMIN_USER or None}
+    return sessions.verify(tok)
+
+def _principal():
+    if "principal" not in g:
+        g.principal = current_principal()
+    return g.principal
+
 def require_admin(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
-        tok = _extract_token()
-        if not ADMIN_TOKEN:
-            return jsonify({"error":"admin token not configured"}), 500
-        if tok != ADMIN_TOKEN:
+        if _principal() is None:
             return jsonify({"error":"unauthorized"}), 401
         return f(*args, **kwargs)
     return wrapper
 
+def _client_key():
+    """Rate-limit identity: the staff account (or service token) if authenticated, else the client IP.
+
+    None (not limited) for anonymous requests from a loopback/private peer while TRUSTED_PROXY_HOPS
+    is 0: that peer is almost certainly an unconfigured proxy, and one bucket would throttle everyone.
+    """
+    p = _principal()
+    if p is not None:
+        return f"user:{p['user_id']}" if p["user_id"] is not None else "admin"
+    if not TRUSTED_PROXY_HOPS and _proxy_like(request.remote_addr):
+        return None
+    return f"ip:{request.remote_addr}"
+
+@lru_cache(maxsize=256)
+def _proxy_like(addr):
+    try:
+        local = ipaddress.ip_address(addr).is_private  # loopback, Docker bridge, LAN
+    except ValueError:
+        return False
+    if local:  # once per address, thanks to the cache
+        app.logger.warning("per-client rate limits are off for requests from %s: set TRUSTED_PROXY_HOPS "
+                           "if this is a reverse proxy", addr)
+    return local
+
+def _too_many(wait):
+    metrics.REQUESTS_REJECTED.labels(reason="rate_limit").inc()
+    retry = max(1, math.ceil(wait))
+    resp = jsonify({"error": "rate limited", "retry_after": retry})
+    resp.status_code = 429
+    resp.headers["Retry-After"] = str(retry)
+    return resp
+
+def rate_limited(rule):
+    def deco(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            key = _client_key()
+            wait = key is not None and limiter.hit(rule, key)
+            if wait:
+                return _too_many(wait)
+            return f(*args, **kwargs)
+        return wrapper
+    return deco
+
+def _set_session_cookie(resp, token):
+    # HttpOnly cookie with Bearer token (works through nginx/https)
+    resp.set_cookie(
+        "Authorization", f"Bearer {token}",
+        max_age=SESSION_TTL,
+        path="/", secure=True, httponly=True, samesite="Lax"
+    )
+    return resp
+
+# ---------------- Admission control ----------------
+SHED_EXEMPT = {"/health", "/metrics"}
+
+@app.before_request
+def _admit():
+    g._inflight = True
+    # shed anonymous traffic first so staff requests keep their latency under overload
+    if inflight.enter() > SHED_MAX_INFLIGHT > 0 and request.path not in SHED_EXEMPT and _principal() is None:
+        metrics.REQUESTS_REJECTED.labels(reason="overload").inc()
+        resp = jsonify({"error": "server busy"})
+        resp.status_code = 503
+        resp.headers["Retry-After"] = "1"
+        return resp
+
+@app.teardown_request
+def _admit_done(exc):
+    if g.pop("_inflight", False):
+        inflight.leave()
+
 # ---------------- Health / Me ----------------
 @app.get("/health")
 def health():
-    return jsonify({"status":"ok"})
+    return jsonify({"status":"ok", "presign_cache": presign_cache.stats()})
 
 @app.get("/me")
 def me():
-    tok = _extract_token()
-    return jsonify({
-        "is_admin": bool(ADMIN_TOKEN and tok == ADMIN_TOKEN),
-        "user": ADMIN_USER if tok == ADMIN_TOKEN else None
-    })
+    p = current_principal()
+    return jsonify({"is_admin": p is not None, "user": p["email"] if p else None})
+
+@app.get("/metrics")
+def metrics_endpoint():
+    if METRICS_TOKEN and not same_secret(_extract_token(), METRICS_TOKEN):
+        return jsonify({"error":"unauthorized"}), 401
+    body, ctype = metrics.render()
+    return Response(body, content_type=ctype)
 
 # ---------------- Patients ----------------
 @app.get("/patients")
+@rate_limited("public")
+@cached_list("patients")
 def patients_list():
+    try:
+        limit, after = _page_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    filters = []
+    if request.args.get("phone"):
+        filters.append(Patient.phone == request.args["phone"])
+    if wants_ndjson():
+        return ndjson_stream(Patient, filters, patient_json, after)
     with SessionLocal() as db:
-        items = db.query(Patient).all()
-        return jsonify([{
-            "id": p.id, "full_name": p.full_name, "phone": p.phone,
-            "photo_url": presigned_get(p.photo_key)
-        } for p in items])
+        items, nxt = keyset_page(db, Patient, filters, limit, after)
+        return jsonify({"items": [patient_json(p) for p in items], "next_cursor": nxt})
 
 @app.post("/patients")
 @require_admin
@@ -113,35 +516,31 @@ def patients_create():
     data = request.get_json(force=True)
     with SessionLocal() as db:
         p = Patient(full_name=data["full_name"], phone=data.get("phone"))
-        db.add(p); db.commit(); db.refresh(p)
+        db.add(p); bump_versions(db, "patients"); db.commit(); db.refresh(p)
         return jsonify({"id": p.id, "full_name": p.full_name, "phone": p.phone}), 201
 
 @app.post("/patients/photo")
 @require_admin
 def patients_photo():
-    pid = request.form.get("id")
-    file = request.files.get("file")
-    if not pid or not file:
-        return jsonify({"error":"id and file required"}), 400
-    ext = file.filename.rsplit(".",1)[-1].lower() if "." in file.filename else ""
-    if ext not in ALLOWED:
-        return jsonify({"error":"allowed: jpg,jpeg,png,webp"}), 400
-    with SessionLocal() as db:
-        p = db.get(Patient, int(pid))
-        if not p: return jsonify({"error":"Patient not found"}), 404
-        key = save_photo_to_s3(file, "patients", p.id)
-        p.photo_key = key; db.commit()
-        return jsonify({"id": p.id, "photo_url": presigned_get(key)}), 201
+    return queue_photo_upload("patients", "Patient")
 
 # ---------------- Doctors ----------------
 @app.get("/doctors")
+@rate_limited("public")
+@cached_list("doctors")
 def doctors_list():
+    try:
+        limit, after = _page_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    filters = []
+    if request.args.get("specialty"):
+        filters.append(Doctor.specialty == request.args["specialty"])
+    if wants_ndjson():
+        return ndjson_stream(Doctor, filters, doctor_json, after)
     with SessionLocal() as db:
-        items = db.query(Doctor).all()
-        return jsonify([{
-            "id": d.id, "full_name": d.full_name, "specialty": d.specialty,
-            "photo_url": presigned_get(d.photo_key)
-        } for d in items])
+        items, nxt = keyset_page(db, Doctor, filters, limit, after)
+        return jsonify({"items": [doctor_json(d) for d in items], "next_cursor": nxt})
 
 @app.post("/doctors")
 @require_admin
@@ -149,49 +548,206 @@ def doctors_create():
     data = request.get_json(force=True)
     with SessionLocal() as db:
         d = Doctor(full_name=data["full_name"], specialty=data.get("specialty"))
-        db.add(d); db.commit(); db.refresh(d)
+        db.add(d); bump_versions(db, "doctors"); db.commit(); db.refresh(d)
         return jsonify({"id": d.id, "full_name": d.full_name, "specialty": d.specialty}), 201
 
 @app.post("/doctors/photo")
 @require_admin
 def doctors_photo():
-    did = request.form.get("id")
-    file = request.files.get("file")
-    if not did or not file:
-        return jsonify({"error":"id and file required"}), 400
-    ext = file.filename.rsplit(".",1)[-1].lower() if "." in file.filename else ""
-    if ext not in ALLOWED:
-        return jsonify({"error":"allowed: jpg,jpeg,png,webp"}), 400
+    return queue_photo_upload("doctors", "Doctor")
+
+# ---------------- Search ----------------
+@app.get("/search")
+@require_admin
+def search_people():
+    """?q= prefix search over names, phones and specialties; ?type=patient|doctor; paged by ?limit=&after=."""
+    q = (request.args.get("q") or "").strip()
+    if not q:
+        return jsonify({"error":"q required"}), 400
+    kinds = {request.args["type"]} if request.args.get("type") else {"patient", "doctor"}
+    if not kinds <= {"patient", "doctor"}:
+        return jsonify({"error":"type must be patient or doctor"}), 400
+    try:
+        limit, after = _page_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    with SessionLocal() as db:
+        hits, more = search.search(db, q, kinds, limit, after)
+        pids = [i for k, i in hits if k == "patient"]
+        dids = [i for k, i in hits if k == "doctor"]
+        rows = {("patient", p.id): p for p in db.query(Patient).filter(Patient.id.in_(pids))} if pids else {}
+        if dids:
+            rows.update({("doctor", d.id): d for d in db.query(Doctor).filter(Doctor.id.in_(dids))})
+        items = []
+        for k, i in hits:
+            row = rows.get((k, i))
+            if row is not None:
+                items.append({"type": k, **(patient_json(row) if k == "patient" else doctor_json(row))})
+        return jsonify({"items": items, "next_cursor": str(after + limit) if more else None})
+
+# ---------------- Bulk import ----------------
+@app.post("/patients/bulk")
+@app.post("/doctors/bulk")
+@app.post("/appointments/bulk")
+@require_admin
+def bulk_create():
+    """JSON array, NDJSON (application/x-ndjson) or CSV (text/csv) body; invalid rows are reported, not fatal."""
+    kind = request.path.split("/")[1]
+    try:
+        result = bulk_import(SessionLocal, kind, iter_rows(request), batch_size=BULK_BATCH)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result), 201 if result["inserted"] else 400
+
+# ---------------- Local media (STORAGE_BACKEND=local) ----------------
+@app.get("/media/<path:key>")
+def media(key):
+    if not isinstance(storage, LocalStorage):
+        return jsonify({"error":"not found"}), 404
+    left = storage.verify(key, request.args.get("exp"), request.args.get("sig"))
+    if left is None:
+        return jsonify({"error":"invalid or expired signature"}), 403
+    try:
+        path = storage.path(key)
+    except ValueError:
+        return jsonify({"error":"not found"}), 404
+    if not os.path.isfile(path):
+        return jsonify({"error":"not found"}), 404
+    # send_file hands the fd to the server's file_wrapper (sendfile under Gunicorn) and answers If-None-Match with 304
+    return send_file(path, conditional=True, etag=True, max_age=left)
+
+# ---------------- Photo jobs ----------------
+@app.get("/photos/jobs/<job_id>")
+@require_admin
+def photo_job_status(job_id):
     with SessionLocal() as db:
-        d = db.get(Doctor, int(did))
-        if not d: return jsonify({"error":"Doctor not found"}), 404
-        key = save_photo_to_s3(file, "doctors", d.id)
-        d.photo_key = key; db.commit()
-        return jsonify({"id": d.id, "photo_url": presigned_get(key)}), 201
+        job = db.get(PhotoJob, job_id)
+        if not job: return jsonify({"error":"Job not found"}), 404
+        if job.status in ("queued", "processing") and job.created_at \
+                and job.created_at < datetime.utcnow() - timedelta(seconds=PHOTO_JOB_STALE):
+            fail_stale_photo_jobs()  # its worker died after startup; don't leave the client polling forever
+            db.refresh(job)
+        return jsonify(job_json(job))
 
 # ---------------- Appointments ----------------
 @app.get("/appointments")
+@rate_limited("public")
+@cached_list("appointments", expand_tables={"patient": "patients", "doctor": "doctors"})
 def appt_list():
+    try:
+        limit, after = _page_args()
+        doctor_id, patient_id = _int_arg("doctor_id"), _int_arg("patient_id")
+        dt_from, dt_to = _dt_arg("from"), _dt_arg("to")
+        expand, options = _expand_arg()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    filters = []
+    if doctor_id is not None:  filters.append(Appointment.doctor_id == doctor_id)
+    if patient_id is not None: filters.append(Appointment.patient_id == patient_id)
+    if dt_from is not None:    filters.append(Appointment.date_time >= dt_from)
+    if dt_to is not None:      filters.append(Appointment.date_time < dt_to)
+    to_json = lambda a: appt_json(a, expand)
+    if wants_ndjson():
+        return ndjson_stream(Appointment, filters, to_json, after, options)
     with SessionLocal() as db:
-        appts = db.query(Appointment).all()
-        return jsonify([{
-            "id": a.id, "patient_id": a.patient_id, "doctor_id": a.doctor_id,
-            "date_time": a.date_time.isoformat() if getattr(a, "date_time", None) else None,
-            "reason": a.reason
-        } for a in appts])
+        appts, nxt = keyset_page(db, Appointment, filters, limit, after, options)
+        return jsonify({"items": [to_json(a) for a in appts], "next_cursor": nxt})
 
 @app.post("/appointments")
 @require_admin
 def appt_create():
     data = request.get_json(force=True)
+    try:
+        dt = parse_dt(data["date_time"], "date_time") if data.get("date_time") else None
+        expand, options = _expand_arg()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     with SessionLocal() as db:
         a = Appointment(patient_id=data["patient_id"], doctor_id=data.get("doctor_id"), reason=data.get("reason"))
-        db.add(a); db.commit(); db.refresh(a)
-        return jsonify({
-            "id": a.id, "patient_id": a.patient_id, "doctor_id": a.doctor_id,
-            "date_time": a.date_time.isoformat() if getattr(a, "date_time", None) else None,
-            "reason": a.reason
-        }), 201
+        db.add(a)
+        if dt is not None:
+            a.date_time = dt
+            if a.doctor_id is not None:
+                try:
+                    reserve_slot(db, a)
+                except ValueError as e:
+                    db.rollback()
+                    return jsonify({"error": str(e)}), 400
+                except SlotTaken:
+                    db.rollback()
+                    return jsonify({"error": "slot already booked"}), 409
+        db.flush()
+        analytics.record(db, [a.id])
+        bump_versions(db, "appointments"); db.commit()
+        a = db.query(Appointment).options(*options).filter(Appointment.id == a.id).one()
+        return jsonify(appt_json(a, expand)), 201
+
+# ---------------- Doctor schedules ----------------
+@app.get("/doctors/<int:did>/schedule")
+@rate_limited("public")
+def doctor_schedule(did):
+    with SessionLocal() as db:
+        if not db.get(Doctor, did): return jsonify({"error":"Doctor not found"}), 404
+        hours = db.query(DoctorHours).filter(DoctorHours.doctor_id == did)\
+                  .order_by(DoctorHours.weekday, DoctorHours.start_minute).all()
+        return jsonify({"doctor_id": did, "hours": [hours_json(h) for h in hours]})
+
+@app.put("/doctors/<int:did>/schedule")
+@require_admin
+def doctor_schedule_set(did):
+    data = request.get_json(force=True)
+    try:
+        windows = parse_hours(data.get("hours") if isinstance(data, dict) else data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    with SessionLocal() as db:
+        if not db.get(Doctor, did): return jsonify({"error":"Doctor not found"}), 404
+        db.query(DoctorHours).filter(DoctorHours.doctor_id == did).delete()
+        db.add_all(DoctorHours(doctor_id=did, **w) for w in windows)
+        db.commit()
+    return doctor_schedule(did)
+
+@app.get("/doctors/<int:did>/availability")
+@rate_limited("public")
+def doctor_availability(did):
+    try:
+        start, end = _dt_arg("from"), _dt_arg("to")
+        if start is None:
+            start = datetime.utcnow().replace(second=0, microsecond=0)
+        if end is None:
+            end = start + timedelta(days=7)
+        with SessionLocal() as db:
+            if not db.get(Doctor, did): return jsonify({"error":"Doctor not found"}), 404
+            slots = availability(db, did, start, end)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"doctor_id": did, "from": start.isoformat(), "to": end.isoformat(), "slots": slots})
+
+# ---------------- Analytics ----------------
+@app.get("/analytics/appointments")
+@require_admin
+def appointment_analytics():
+    try:
+        end, start = _dt_arg("to"), _dt_arg("from")
+        end = end.date() if end else datetime.utcnow().date()
+        start = start.date() if start else end - timedelta(days=29)
+        doctor_id = _int_arg("doctor_id")
+        with SessionLocal() as db:
+            # rollups only change with appointments; names/specialties come from doctors
+            etag = make_etag("analytics", table_version(db, "appointments"), table_version(db, "doctors"),
+                             start, end, request.query_string.decode())
+            if request.if_none_match.contains(etag):
+                resp = Response(status=304)
+            else:
+                resp = jsonify(analytics.appointment_stats(
+                    db, start, end, interval=request.args.get("interval", "day"),
+                    by=request.args.get("by", "specialty"), doctor_id=doctor_id,
+                    specialty=request.args.get("specialty") or None))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
 
 # ---------------- Auth pages ----------------
 LOGIN_HTML = """
@@ -241,49 +797,79 @@ async function login(e){
 
 @app.get("/login")
 def login_page():
-    return Response(LOGIN_HTML.replace("%%HOSPITAL%%", HOSPITAL), mimetype="text/html")
+    return static_page("login", HOSPITAL).response(f"public, max-age={PAGE_MAX_AGE}")
 
 @app.post("/login")
+@rate_limited("login")
 def login_post():
     data = request.get_json(silent=True) or {}
     email = (data.get("email") or "").strip()
     pw    = data.get("password") or ""
-    if ADMIN_USER and ADMIN_PASS and email.lower() == ADMIN_USER.lower() and pw == ADMIN_PASS:
-        resp = make_response(jsonify({"ok":True}))
-        # HttpOnly cookie with Bearer token (works through nginx/https)
-        resp.set_cookie(
-            "Authorization", f"Bearer {ADMIN_TOKEN}",
-            max_age=int(timedelta(days=7).total_seconds()),
-            path="/", secure=True, httponly=True, samesite="Lax"
-        )
-        return resp
-    return jsonify({"error":"invalid"}), 401
+    if not email or not pw:
+        return jsonify({"error":"invalid"}), 401
+    # per-account budget too, so guessing one password from many addresses is still throttled
+    wait = limiter.hit("login_account", email.lower())
+    if wait:
+        return _too_many(wait)
+    uid = sessions.authenticate(email, pw)
+    if uid is None and ADMIN_USER and ADMIN_PASS and same_secret(email.lower(), ADMIN_USER.lower()) \
+            and same_secret(pw, ADMIN_PASS):
+        # bootstrap account from the environment; (re)synced lazily so a changed ADMIN_PASSWORD takes effect,
+        # but once deactivated through DELETE /staff it stays off
+        uid = sessions.upsert_user(ADMIN_USER, ADMIN_PASS, reactivate=False)
+    if uid is None:
+        return jsonify({"error":"invalid"}), 401
+    token, expires = sessions.issue(uid)
+    resp = make_response(jsonify({"ok":True, "token": token, "expires_at": expires.isoformat()}))
+    return _set_session_cookie(resp, token)
 
 @app.get("/logout")
 def logout():
+    tok = _extract_token()
+    if tok and not (ADMIN_TOKEN and same_secret(tok, ADMIN_TOKEN)):
+        sessions.revoke(tok)
     resp = make_response(redirect("/site", code=302))
     resp.set_cookie("Authorization", "", max_age=0, path="/", secure=True, httponly=True, samesite="Lax")
     return resp
 
 @app.get("/login/token")
+@rate_limited("login")
 def login_token():
     # Quick login via URL: /login/token?token=...
     tok = request.args.get("token","")
-    if tok and ADMIN_TOKEN and tok == ADMIN_TOKEN:
-        resp = make_response(redirect("/console", code=302))
-        resp.set_cookie(
-            "Authorization", f"Bearer {ADMIN_TOKEN}",
-            max_age=int(timedelta(days=7).total_seconds()),
-            path="/", secure=True, httponly=True, samesite="Lax"
-        )
-        return resp
+    if tok and ADMIN_TOKEN and same_secret(tok, ADMIN_TOKEN):
+        # trade the long-lived admin token for a revocable session instead of putting it in the cookie
+        session_token, _ = sessions.issue(None)
+        return _set_session_cookie(make_response(redirect("/console", code=302)), session_token)
     return jsonify({"error":"unauthorized"}), 401
 
-# ---------------- Admin Console (cookie or header auth) ----------------
-@app.get("/console")
+# ---------------- Staff accounts ----------------
+@app.post("/staff")
 @require_admin
-def console():
-    html = """
+def staff_create():
+    data = request.get_json(force=True)
+    email = (data.get("email") or "").strip()
+    pw = data.get("password") or ""
+    if "@" not in email or len(pw) < 8:
+        return jsonify({"error":"email and a password of at least 8 characters required"}), 400
+    with SessionLocal() as db:
+        if db.query(StaffUser.id).filter(StaffUser.email == email.lower()).first():
+            return jsonify({"error":"email already registered"}), 409
+    uid = sessions.upsert_user(email, pw)
+    return jsonify({"id": uid, "email": email.lower()}), 201
+
+@app.delete("/staff/<int:uid>")
+@require_admin
+def staff_deactivate(uid):
+    with SessionLocal() as db:
+        user = db.get(StaffUser, uid)
+        if not user: return jsonify({"error":"Staff user not found"}), 404
+        user.is_active = False; db.commit()
+    sessions.revoke_user(uid)
+    return jsonify({"id": uid, "is_active": False})
+
+# ---------------- Admin Console (cookie or header auth) ----------------
+CONSOLE_HTML = """
     <html><body style="font-family: system-ui; max-width: 900px; margin:2rem auto;">
       <h2>Hospital Console</h2>
       <p><a href="/logout">Log out</a></p>
@@ -330,8 +916,8 @@ def console():
           alert(await r.text());
         }
         async function loadAll(){
-          const [p,d] = await Promise.all([fetch('/patients'), fetch('/doctors')]);
-          const patients = await p.json(), doctors = await d.json();
+          const [p,d] = await Promise.all([fetch('/patients?limit=200&size=card&image_format=webp'), fetch('/doctors?limit=200&size=card&image_format=webp')]);
+          const patients = (await p.json()).items, doctors = (await d.json()).items;
           const h = (list,title)=> '<h4>'+title+'</h4><div style="display:grid;grid-template-columns:repeat(auto-fill, minmax(180px,1fr));gap:10px;">' +
             list.map(x=>'<div style="border:1px solid #ddd;border-radius:12px;padding:10px">'+
               (x.photo_url?'<img src="'+x.photo_url+'" style="width:100%;height:160px;object-fit:cover;border-radius:8px;"/>' : '<div style="height:160px;background:#f4f4f4;border-radius:8px;display:grid;place-items:center;color:#888">No photo</div>')+
@@ -344,7 +930,11 @@ def console():
       </script>
     </body></html>
     """
-    return Response(html, mimetype="text/html")
+
+@app.get("/console")
+@require_admin
+def console():
+    return static_page("console", HOSPITAL).response(f"private, max-age={PAGE_MAX_AGE}")
 
 # ---------------- Public Homepage ----------------
 SITE_HTML = """
@@ -442,6 +1032,7 @@ SITE_HTML = """
   </footer>
 </div>
 
+<script>window.__DIRECTORY__ = %%DIRECTORY_JSON%%;</script>
 <script>
 function renderCards(list){
   return list.map(x=>`
@@ -463,7 +1054,10 @@ function pickFounderPhoto(doctors){
   }
 }
 async function loadDirectory(){
-  const [dr, pt] = await Promise.all([fetch('/doctors').then(r=>r.json()), fetch('/patients').then(r=>r.json())]);
+  const pre = window.__DIRECTORY__;
+  const [dr, pt] = pre ? [pre.doctors, pre.patients] :
+    await Promise.all([fetch('/doctors?limit=100&size=card&image_format=webp').then(r=>r.json()).then(j=>j.items),
+                       fetch('/patients?limit=100&size=card&image_format=webp').then(r=>r.json()).then(j=>j.items)]);
   document.getElementById('doctors').innerHTML = renderCards(dr);
   document.getElementById('patients').innerHTML = renderCards(pt);
   pickFounderPhoto(dr);
@@ -473,12 +1067,48 @@ loadDirectory();
 </body></html>
 """
 
+# ---------------- Pre-rendered pages ----------------
+@lru_cache(maxsize=8)
+def static_page(name, hospital):
+    """/login and /console, rendered and compressed once per HOSPITAL_NAME."""
+    html = {"login": LOGIN_HTML, "console": CONSOLE_HTML}[name]
+    return PrecompressedPage(html.replace("%%HOSPITAL%%", hospital))
+
+@lru_cache(maxsize=4)
+def site_shell(hospital, founder):
+    return SITE_HTML.replace("%%HOSPITAL%%", hospital)\
+                    .replace("%%FOUNDER%%", founder)\
+                    .replace("%%FOUNDER_JS%%", json.dumps(founder))
+
+_site_page = (None, None)  # (key, page), swapped as one tuple so threads never see a torn pair
+
+def site_page():
+    """/site with the first page of the directory inlined; re-rendered only when the data or names change."""
+    global _site_page
+    with SessionLocal() as db:
+        key = (HOSPITAL, FOUNDER, table_version(db, "doctors"), table_version(db, "patients"),
+               int(time.time() // max(1, presign_cache.max_age)))
+        cached_key, cached_page = _site_page
+        if cached_key == key:
+            return cached_page
+        doctors, _ = keyset_page(db, Doctor, [], SITE_DIRECTORY_LIMIT, 0)
+        patients, _ = keyset_page(db, Patient, [], SITE_DIRECTORY_LIMIT, 0)
+        photo = {"size": "card", "fmt": "webp" if "webp" in image_formats() else "jpg"}
+        directory = {"doctors": [doctor_json(d, **photo) for d in doctors],
+                     "patients": [patient_json(p, **photo) for p in patients]}
+    # escape "<" so names can never close the inline <script>
+    inline = json.dumps(directory).replace("<", "\\u003c")
+    page = PrecompressedPage(site_shell(HOSPITAL, FOUNDER).replace("%%DIRECTORY_JSON%%", inline), brotli_quality=5)
+    _site_page = (key, page)
+    return page
+
+for _name in ("login", "console"):
+    static_page(_name, HOSPITAL)
+
 @app.get("/site")
+@rate_limited("site")
 def site():
-    html = SITE_HTML.replace("%%HOSPITAL%%", HOSPITAL)\
-                    .replace("%%FOUNDER%%", FOUNDER)\
-                    .replace("%%FOUNDER_JS%%", json.dumps(FOUNDER))
-    return Response(html, mimetype="text/html")
+    return site_page().response(f"public, max-age={LIST_MAX_AGE}, must-revalidate")
 
 @app.get("/")
 def root():
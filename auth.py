@@ -0,0 +1,125 @@
+import os, hmac, hashlib, secrets, threading, time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from models import StaffUser, StaffSession
+
+PBKDF2_ITERS = 200_000
+
+def hash_password(pw: str) -> str:
+    salt = os.urandom(16)
+    dk = hashlib.pbkdf2_hmac("sha256", pw.encode(), salt, PBKDF2_ITERS)
+    return f"pbkdf2_sha256${PBKDF2_ITERS}${salt.hex()}${dk.hex()}"
+
+def check_password(pw: str, stored: str) -> bool:
+    try:
+        _, iters, salt, want = stored.split("$")
+        dk = hashlib.pbkdf2_hmac("sha256", pw.encode(), bytes.fromhex(salt), int(iters))
+    except ValueError:
+        return False
+    return hmac.compare_digest(dk.hex(), want)
+
+def same_secret(a: str, b: str) -> bool:
+    """Constant-time string comparison that also copes with non-ASCII input."""
+    return hmac.compare_digest(a.encode(), b.encode())
+
+def token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+class SessionStore:
+    """Issues bearer tokens and verifies them through a bounded in-memory cache.
+
+    Only token hashes touch the database. A verified (or rejected) token is cached
+    for at most `cache_seconds`, so a request normally costs one hash and a dict
+    lookup; revocations are immediate in this worker and reach other workers
+    within `cache_seconds`.
+    """
+
+    def __init__(self, session_factory, ttl_seconds=7 * 86400, cache_size=10000, cache_seconds=30):
+        self.session_factory = session_factory
+        self.ttl_seconds = ttl_seconds
+        self.cache_size = cache_size
+        self.cache_seconds = cache_seconds
+        self._cache = OrderedDict()  # token_hash -> (principal | None, valid_until monotonic)
+        self._lock = threading.Lock()
+        self._dummy_hash = None
+
+    def authenticate(self, email: str, password: str):
+        """Return the active StaffUser id for these credentials, or None."""
+        with self.session_factory() as db:
+            user = db.query(StaffUser).filter(StaffUser.email == email.lower()).first()
+            if user is None:
+                # burn the same time as a real check so unknown emails are not distinguishable
+                if self._dummy_hash is None:
+                    self._dummy_hash = hash_password(secrets.token_hex(8))
+                check_password(password, self._dummy_hash)
+                return None
+            if user.is_active and check_password(password, user.password_hash):
+                return user.id
+            return None
+
+    def upsert_user(self, email: str, password: str, reactivate: bool = True):
+        """Create or update a staff user; returns its id, or None for a deactivated one when not reactivating."""
+        with self.session_factory() as db:
+            user = db.query(StaffUser).filter(StaffUser.email == email.lower()).first()
+            if user is None:
+                user = StaffUser(email=email.lower(), password_hash=hash_password(password), is_active=True)
+                db.add(user)
+            elif not user.is_active and not reactivate:
+                return None
+            else:
+                user.password_hash, user.is_active = hash_password(password), True
+            db.commit()
+            return user.id
+
+    def issue(self, user_id=None):
+        """Create a session; returns (token, expires_at). The raw token is never stored."""
+        token = secrets.token_urlsafe(32)
+        expires = datetime.utcnow() + timedelta(seconds=self.ttl_seconds)
+        with self.session_factory() as db:
+            db.add(StaffSession(token_hash=token_hash(token), user_id=user_id, expires_at=expires))
+            db.commit()
+        return token, expires
+
+    def verify(self, token: str):
+        """Return {"user_id", "email"} for a live session token, else None."""
+        h = token_hash(token)
+        now = time.monotonic()
+        with self._lock:
+            hit = self._cache.get(h)
+            if hit and hit[1] > now:
+                self._cache.move_to_end(h)
+                return hit[0]
+        principal, ttl = None, self.cache_seconds
+        with self.session_factory() as db:
+            row = db.query(StaffSession).filter(StaffSession.token_hash == h).first()
+            if row is not None and row.revoked_at is None:
+                left = (row.expires_at - datetime.utcnow()).total_seconds()
+                user = row.user
+                if left > 0 and (user is None or user.is_active):
+                    principal = {"user_id": row.user_id, "email": user.email if user else None}
+                    ttl = min(ttl, left)
+        with self._lock:
+            self._cache[h] = (principal, now + ttl)
+            self._cache.move_to_end(h)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return principal
+
+    def revoke(self, token: str):
+        h = token_hash(token)
+        with self.session_factory() as db:
+            db.execute(update(StaffSession).where(StaffSession.token_hash == h, StaffSession.revoked_at.is_(None))
+                       .values(revoked_at=datetime.utcnow()))
+            db.commit()
+        with self._lock:
+            self._cache.pop(h, None)
+
+    def revoke_user(self, user_id: int):
+        with self.session_factory() as db:
+            db.execute(update(StaffSession).where(StaffSession.user_id == user_id, StaffSession.revoked_at.is_(None))
+                       .values(revoked_at=datetime.utcnow()))
+            db.commit()
+        with self._lock:
+            for h in [h for h, (p, _) in self._cache.items() if p and p["user_id"] == user_id]:
+                del self._cache[h]
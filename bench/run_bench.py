@@ -0,0 +1,405 @@
+"""Reproducible load test / micro-benchmark for the hospital API.
+
+Seeds a throw-away SQLite database, swaps the S3 client's put_object for an
+in-memory fake (presigning still runs through real botocore with dummy
+credentials, so signing cost is realistic), then drives the app through the
+Flask test client and/or a real Gunicorn process. For every endpoint it records
+p50/p95/p99 latency, requests per second and peak RSS, and writes JSON so runs
+can be compared:
+
+    python bench/run_bench.py --patients 20000 --doctors 500 --appointments 100000
+    python bench/run_bench.py --mode gunicorn --workers 4 --concurrency 16 --out after.json
+    python bench/run_bench.py --mode gunicorn --worker-class sync --workers 1 --concurrency 16
+    python bench/run_bench.py --compare before.json after.json
+"""
+import argparse, glob, http.client, json, os, platform, random, shutil, subprocess, sys, tempfile, threading, time, uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import quote
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+PHOTOS = sorted(glob.glob(os.path.join(ROOT, "assets", "photos", "*", "*", "*.jpg")))
+TOKEN = "bench-token"
+AUTH = {"Authorization": f"Bearer {TOKEN}"}
+SPECIALTIES = ["Cardiology", "Pediatrics", "Dermatology", "Neurology", "Oncology", "Radiology", "General Practice"]
+FIRST = ["Ada", "Chidi", "Ngozi", "Tunde", "Amaka", "Emeka", "Zainab", "Ife", "Kemi", "Obi", "Sade", "Musa"]
+LAST = ["Okafor", "Bello", "Adeyemi", "Eze", "Nwosu", "Balogun", "Ibrahim", "Okonkwo", "Udie", "Afolabi"]
+# dates are relative to today: availability only lists future slots, so the seeded appointments
+# (every half hour from SEED_START over ~21 weeks) run a few weeks past NEXT_MONDAY
+_today = datetime.utcnow().date()
+NEXT_MONDAY = datetime.combine(_today + timedelta(days=7 - _today.weekday()), datetime.min.time())
+SEED_START = NEXT_MONDAY - timedelta(weeks=16) + timedelta(hours=8)
+
+# ---------------- Environment ----------------
+def bench_env(workdir):
+    return {
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.sqlite3')}",
+        "ADMIN_TOKEN": TOKEN,
+        "STORAGE_BACKEND": "s3",
+        "S3_BUCKET": "bench-bucket",
+        "AWS_REGION": "eu-north-1",
+        "AWS_ACCESS_KEY_ID": "AKIABENCHMARK000000",
+        "AWS_SECRET_ACCESS_KEY": "bench-secret",
+        "PROMETHEUS_MULTIPROC_DIR": os.path.join(workdir, "prom"),
+        # every bench request comes from one address; measure the endpoints, not the limiter
+        "RATE_LIMIT_PUBLIC": "off", "RATE_LIMIT_SITE": "off",
+    }
+
+class FakeS3:
+    """put_object into memory; everything else (presigning) goes to the real botocore client."""
+
+    def __init__(self, real):
+        self._real = real
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, **kw):
+        self.objects[Key] = len(Body if isinstance(Body, bytes) else Body.read())
+        return {"ETag": uuid.uuid4().hex}
+
+    def __getattr__(self, name):
+        return getattr(self._real, name)
+
+def load_app():
+    sys.path.insert(0, ROOT)
+    import migrate
+    migrate.upgrade()
+    import app as hospital
+    hospital.storage._client = FakeS3(hospital.storage.client)
+    return hospital
+
+def gunicorn_app():
+    """Gunicorn entry point: `run_bench:gunicorn_app()`."""
+    return load_app().app
+
+# ---------------- Seeding ----------------
+def seed(hospital, patients, doctors, appointments, rnd):
+    from sqlalchemy import insert
+    from http_cache import bump_versions
+    m = hospital
+    name = lambda: f"{rnd.choice(FIRST)} {rnd.choice(LAST)}"
+    photo = lambda kind, i: f"{kind}/{i}/photo-{uuid.UUID(int=i).hex}/full.jpg" if rnd.random() < .7 else None
+    with m.SessionLocal() as db:
+        for model, n, row in (
+            (m.Patient, patients, lambda i: {"full_name": name(), "phone": f"+234 80{rnd.randrange(10**8):08d}",
+                                             "photo_key": photo("patients", i)}),
+            (m.Doctor, doctors, lambda i: {"full_name": "Dr " + name(), "specialty": rnd.choice(SPECIALTIES),
+                                           "photo_key": photo("doctors", i)}),
+            (m.Appointment, appointments, lambda i: {
+                "patient_id": rnd.randint(1, max(1, patients)), "doctor_id": rnd.randint(1, max(1, doctors)),
+                "date_time": SEED_START + timedelta(minutes=30 * rnd.randrange(365 * 20)), "reason": "Check-up"}),
+        ):
+            for lo in range(0, n, 5000):
+                db.execute(insert(model), [row(i) for i in range(lo + 1, min(n, lo + 5000) + 1)])
+        bump_versions(db, "patients", "doctors", "appointments")
+        db.commit()
+        for d in range(1, min(doctors, 50) + 1):
+            for wd in range(5):
+                db.add(m.DoctorHours(doctor_id=d, weekday=wd, start_minute=9 * 60, end_minute=17 * 60, slot_minutes=30))
+        db.commit()
+    import search, analytics
+    from db import engine
+    search.rebuild(engine)
+    analytics.rebuild(engine)  # seeded rows bypass the app's write path
+
+# ---------------- Targets ----------------
+class ClientTarget:
+    """In-process Flask test client (no network, no server overhead)."""
+    concurrency_safe = False
+
+    def __init__(self, hospital):
+        self.client = hospital.app.test_client()
+        self.pids = [os.getpid()]
+
+    def request(self, method, path, body=None, headers=None):
+        r = self.client.open(path, method=method, data=body, headers=headers or {})
+        return r.status_code, r.get_data()
+
+class HttpTarget:
+    """A real Gunicorn server on localhost (one connection per request, as sync workers close them)."""
+    concurrency_safe = True
+
+    def __init__(self, port, master_pid):
+        self.port = port
+        self.master_pid = master_pid
+
+    @property
+    def pids(self):
+        return [self.master_pid] + _children(self.master_pid)
+
+    def request(self, method, path, body=None, headers=None):
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=120)
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            r = conn.getresponse()
+            return r.status, r.read()
+        finally:
+            conn.close()
+
+def _children(pid):
+    out = []
+    for stat in glob.glob("/proc/[0-9]*/stat"):
+        try:
+            with open(stat) as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            if int(fields[1]) == pid:
+                out.append(int(stat.split("/")[2]))
+        except (OSError, IndexError, ValueError):
+            pass
+    return out
+
+# ---------------- Peak RSS ----------------
+def reset_peak_rss(pids):
+    """Writing 5 to clear_refs resets VmHWM (Linux); elsewhere peak RSS is process-lifetime."""
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/clear_refs", "w") as f:
+                f.write("5")
+        except OSError:
+            pass
+
+def peak_rss_mb(pids):
+    """Largest peak RSS among the given processes, in MB."""
+    best = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        best = max(best, int(line.split()[1]) / 1024)
+        except OSError:
+            pass
+    if not best and os.getpid() in pids:
+        import resource
+        kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        best = kb / (1024 * 1024) if sys.platform == "darwin" else kb / 1024
+    return round(best, 1)
+
+# ---------------- Scenarios ----------------
+def multipart(fields, filename, data):
+    boundary = uuid.uuid4().hex
+    parts = [f'--{boundary}\r\nContent-Disposition: form-data; name="{k}"\r\n\r\n{v}\r\n'.encode() for k, v in fields.items()]
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+                 f'Content-Type: image/jpeg\r\n\r\n'.encode() + data + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), {"Content-Type": f"multipart/form-data; boundary={boundary}", **AUTH}
+
+def scenarios(sizes, requests):
+    p, d = max(1, sizes["patients"]), max(1, sizes["doctors"])
+    photos = [open(f, "rb").read() for f in PHOTOS] or [b""]
+    heavy = max(3, requests // 50)
+
+    def upload(target, i, rnd):
+        body, headers = multipart({"id": rnd.randint(1, d)}, "photo.jpg", photos[i % len(photos)])
+        return target.request("POST", "/doctors/photo", body, headers)
+
+    def upload_done(target, i, rnd):
+        status, data = upload(target, i, rnd)
+        if status != 202:
+            return status, data
+        url = json.loads(data)["status_url"]
+        while True:
+            status, data = target.request("GET", url, headers=AUTH)
+            if status != 200 or json.loads(data)["status"] in ("done", "failed"):
+                return (status if json.loads(data).get("status") == "done" else 500), data
+            time.sleep(0.02)
+
+    week = f"from={NEXT_MONDAY.isoformat()}&to={(NEXT_MONDAY + timedelta(days=7)).isoformat()}"
+    year = f"from={SEED_START.date().isoformat()}&to={(SEED_START + timedelta(days=364)).date().isoformat()}"
+    get = lambda path: (lambda target, i, rnd: target.request("GET", path(i, rnd)))
+    auth_get = lambda path: (lambda target, i, rnd: target.request("GET", path(i, rnd), headers=AUTH))
+    return [
+        ("GET /health", requests, get(lambda i, r: "/health")),
+        ("GET /patients page", requests, get(lambda i, r: f"/patients?limit=50&after={r.randrange(p)}")),
+        ("GET /doctors?specialty", requests, get(lambda i, r: f"/doctors?specialty={quote(r.choice(SPECIALTIES))}&after={r.randrange(d)}")),
+        ("GET /appointments?expand", requests,
+         get(lambda i, r: f"/appointments?doctor_id={r.randint(1, d)}&expand=patient,doctor&limit=50")),
+        ("GET /doctors/<id>/availability", requests,
+         get(lambda i, r: f"/doctors/{r.randint(1, min(d, 50))}/availability?{week}")),
+        ("GET /site", requests, get(lambda i, r: "/site")),
+        ("GET /search", requests, auth_get(lambda i, r: f"/search?q={r.choice(FIRST)[:3]}")),
+        ("GET /analytics/appointments", requests,
+         auth_get(lambda i, r: f"/analytics/appointments?{year}&interval=week&by={r.choice(['doctor', 'specialty'])}")),
+        ("GET /patients ndjson export", heavy, get(lambda i, r: "/patients?format=ndjson")),
+        ("POST /patients", requests,
+         lambda target, i, rnd: target.request("POST", "/patients", json.dumps({"full_name": f"Bench {i}"}).encode(),
+                                               {"Content-Type": "application/json", **AUTH})),
+        ("POST /doctors/photo (202)", heavy, upload),
+        ("POST /doctors/photo (processed)", heavy, upload_done),
+    ]
+
+def percentile(sorted_vals, q):
+    if not sorted_vals:
+        return None
+    k = max(0, min(len(sorted_vals) - 1, int(round(q / 100 * len(sorted_vals) + .5)) - 1))
+    return sorted_vals[k]
+
+def run_scenario(target, fn, count, concurrency, seed_value):
+    lat, errors = [], 0
+    lock = threading.Lock()
+    rnd_local = threading.local()
+
+    def one(i):
+        nonlocal errors
+        if not hasattr(rnd_local, "rnd"):
+            rnd_local.rnd = random.Random(seed_value + threading.get_ident())
+        t = time.perf_counter()
+        try:
+            status, _ = fn(target, i, rnd_local.rnd)
+            ok = status < 400
+        except Exception:
+            ok = False
+        dt = time.perf_counter() - t
+        with lock:
+            lat.append(dt)
+            errors += not ok
+
+    reset_peak_rss(target.pids)
+    start = time.perf_counter()
+    if concurrency > 1 and target.concurrency_safe:
+        with ThreadPoolExecutor(concurrency) as ex:
+            list(ex.map(one, range(count)))
+    else:
+        for i in range(count):
+            one(i)
+    wall = time.perf_counter() - start
+    lat.sort()
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return {
+        "requests": count, "errors": errors, "rps": round(count / wall, 1) if wall else None,
+        "p50_ms": ms(percentile(lat, 50)), "p95_ms": ms(percentile(lat, 95)), "p99_ms": ms(percentile(lat, 99)),
+        "max_ms": ms(lat[-1] if lat else None), "peak_rss_mb": peak_rss_mb(target.pids),
+    }
+
+def micro(hospital, rounds):
+    """In-process helpers that dominate list/upload cost."""
+    from photo_jobs import encode_variants
+    out = {}
+    keys = [f"patients/{i}/photo-{uuid.uuid4().hex}/full.jpg" for i in range(rounds)]
+    for label, fn in (("presigned_get cold", lambda k: hospital.presigned_get(k)),
+                      ("presigned_get warm", lambda k: hospital.presigned_get(k))):
+        lat = []
+        for k in keys:
+            t = time.perf_counter(); fn(k); lat.append(time.perf_counter() - t)
+        lat.sort()
+        out[label] = {"calls": len(lat), "p50_us": round(percentile(lat, 50) * 1e6, 1),
+                      "p99_us": round(percentile(lat, 99) * 1e6, 1)}
+    if PHOTOS:
+        raw = open(PHOTOS[0], "rb").read()
+        lat = []
+        for _ in range(max(3, rounds // 200)):
+            t = time.perf_counter(); encode_variants(raw); lat.append(time.perf_counter() - t)
+        lat.sort()
+        out["encode_variants"] = {"calls": len(lat), "p50_ms": round(percentile(lat, 50) * 1000, 1),
+                                  "p99_ms": round(percentile(lat, 99) * 1000, 1)}
+    return out
+
+# ---------------- Gunicorn ----------------
+def start_gunicorn(env, workers, port, worker_class="gthread", threads=8):
+    cmd = [sys.executable, "-m", "gunicorn", "-w", str(workers), "-b", f"127.0.0.1:{port}",
+           "-k", worker_class, "--threads", str(threads),
+           "--pythonpath", f"{BENCH_DIR},{ROOT}", "--log-level", "warning", "run_bench:gunicorn_app()"]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env={**os.environ, **env})
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("gunicorn exited during start-up")
+        try:
+            if HttpTarget(port, proc.pid).request("GET", "/health")[0] == 200 and len(_children(proc.pid)) >= workers:
+                return proc
+        except OSError:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("gunicorn did not become healthy within 60s")
+
+def _free_port():
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+# ---------------- Main ----------------
+def git_rev():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(old_path, new_path):
+    old, new = json.load(open(old_path)), json.load(open(new_path))
+    for mode, results in new["results"].items():
+        print(f"\n[{mode}]  {old['meta'].get('git')} -> {new['meta'].get('git')}")
+        print(f"{'endpoint':36} {'p50 ms':>17} {'p99 ms':>17} {'rps':>17}")
+        for name, r in results.items():
+            o = old["results"].get(mode, {}).get(name)
+            if not o:
+                continue
+            cell = lambda k: f"{o[k]}->{r[k]}"
+            print(f"{name:36} {cell('p50_ms'):>17} {cell('p99_ms'):>17} {cell('rps'):>17}")
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--patients", type=int, default=5000)
+    ap.add_argument("--doctors", type=int, default=200)
+    ap.add_argument("--appointments", type=int, default=20000)
+    ap.add_argument("--requests", type=int, default=300, help="requests per endpoint")
+    ap.add_argument("--mode", choices=["client", "gunicorn", "both"], default="client")
+    ap.add_argument("--workers", type=int, default=max(2, os.cpu_count() or 1))
+    ap.add_argument("--worker-class", default="gthread", help="gunicorn worker class (sync, gthread, gevent)")
+    ap.add_argument("--threads", type=int, default=8, help="threads per gunicorn worker (gthread)")
+    ap.add_argument("--concurrency", type=int, default=8, help="client threads (gunicorn mode)")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", default=None, help="results JSON (default bench/results/<timestamp>.json)")
+    ap.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="print deltas between two result files")
+    args = ap.parse_args()
+    if args.compare:
+        return compare(*args.compare)
+
+    workdir = tempfile.mkdtemp(prefix="hospital-bench-")
+    env = bench_env(workdir)
+    os.makedirs(env["PROMETHEUS_MULTIPROC_DIR"])
+    os.environ.update(env)
+    try:
+        hospital = load_app()
+        sizes = {"patients": args.patients, "doctors": args.doctors, "appointments": args.appointments}
+        t = time.perf_counter()
+        seed(hospital, **sizes, rnd=random.Random(args.seed))
+        print(f"seeded {sizes} in {time.perf_counter() - t:.1f}s", file=sys.stderr)
+
+        report = {"meta": {"git": git_rev(), "timestamp": datetime.utcnow().isoformat() + "Z",
+                           "python": platform.python_version(), "platform": platform.platform(),
+                           "cpus": os.cpu_count(), "sizes": sizes, "requests": args.requests,
+                           "workers": args.workers, "worker_class": args.worker_class,
+                           "threads": args.threads, "concurrency": args.concurrency, "photos": len(PHOTOS)},
+                  "results": {}, "micro": micro(hospital, args.requests)}
+        modes = ["client", "gunicorn"] if args.mode == "both" else [args.mode]
+        for mode in modes:
+            if mode == "client":
+                target, proc = ClientTarget(hospital), None
+            else:
+                port = _free_port()
+                proc = start_gunicorn(env, args.workers, port, args.worker_class, args.threads)
+                target = HttpTarget(port, proc.pid)
+            try:
+                results = report["results"][mode] = {}
+                for name, count, fn in scenarios(sizes, args.requests):
+                    results[name] = run_scenario(target, fn, count, args.concurrency, args.seed)
+                    r = results[name]
+                    print(f"[{mode}] {name:36} p50={r['p50_ms']}ms p95={r['p95_ms']}ms p99={r['p99_ms']}ms "
+                          f"rps={r['rps']} rss={r['peak_rss_mb']}MB errors={r['errors']}", file=sys.stderr)
+            finally:
+                if proc:
+                    proc.terminate()
+                    proc.wait(timeout=30)
+
+        out = args.out or os.path.join(BENCH_DIR, "results", datetime.utcnow().strftime("%Y%m%dT%H%M%SZ") + ".json")
+        os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+        with open(out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(out)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
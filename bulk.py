@@ -0,0 +1,174 @@
+import csv, json
+from sqlalchemy import insert, select
+from models import Patient, Doctor, Appointment
+from http_cache import bump_versions
+import analytics
+from timeutil import parse_dt
+
+IN_CHUNK = 900  # stay under SQLite's bound-parameter limit for IN (...)
+
+def _ndjson_rows(stream):
+    n = 0
+    for line in stream:
+        if not line.strip():
+            continue
+        n += 1
+        try:
+            yield n, json.loads(line)
+        except ValueError as e:
+            yield n, ValueError(f"invalid JSON: {e}")
+
+def _decoded_lines(stream):
+    # decode line by line (not in 8KB chunks) so a bad byte fails at its own row, after every row before it
+    for i, raw in enumerate(stream):
+        yield raw.decode("utf-8-sig" if i == 0 else "utf-8")
+
+def _csv_rows(stream):
+    for n, row in enumerate(csv.DictReader(_decoded_lines(stream)), 1):
+        yield n, {k: (v if v != "" else None) for k, v in row.items() if k}
+
+def iter_rows(request):
+    """(row_number, dict | Exception) iterator over a JSON array, NDJSON or CSV request body.
+
+    A JSON body is parsed (and rejected) up front; NDJSON and CSV are streamed, so a
+    body that turns unreadable part-way raises from the iterator instead.
+    """
+    if request.mimetype == "application/x-ndjson":
+        return _ndjson_rows(request.stream)
+    if request.mimetype == "text/csv":
+        return _csv_rows(request.stream)
+    data = request.get_json(force=True)
+    if not isinstance(data, list):
+        raise ValueError("expected a JSON array")
+    return enumerate(data, 1)
+
+def _str(row, name, maxlen, required=False):
+    v = row.get(name)
+    if v is None or (isinstance(v, str) and not v.strip()):
+        if required:
+            raise ValueError(f"{name} is required")
+        return None
+    v = str(v).strip()
+    if len(v) > maxlen:
+        raise ValueError(f"{name} longer than {maxlen} characters")
+    return v
+
+def _int(row, name, required=False):
+    v = row.get(name)
+    if v is None:
+        if required:
+            raise ValueError(f"{name} is required")
+        return None
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be an integer")
+
+def _dt(row, name):
+    v = row.get(name)
+    if v is None:
+        return None
+    return parse_dt(v, name)
+
+def clean_patient(row):
+    return {"full_name": _str(row, "full_name", 200, True), "phone": _str(row, "phone", 50)}
+
+def clean_doctor(row):
+    return {"full_name": _str(row, "full_name", 200, True), "specialty": _str(row, "specialty", 200)}
+
+def clean_appointment(row):
+    out = {"patient_id": _int(row, "patient_id", True), "doctor_id": _int(row, "doctor_id"),
+           "reason": _str(row, "reason", 500)}
+    dt = _dt(row, "date_time")
+    if dt is not None:
+        out["date_time"] = dt
+    return out
+
+def _existing_ids(db, model, ids):
+    found = set()
+    ids = list(ids)
+    for i in range(0, len(ids), IN_CHUNK):
+        found.update(db.scalars(select(model.id).where(model.id.in_(ids[i:i + IN_CHUNK]))))
+    return found
+
+def check_appointment_fks(db, batch, errors):
+    """Set-based FK check: one IN query per referenced table, instead of a lookup per row."""
+    patients = _existing_ids(db, Patient, {r["patient_id"] for _, r in batch})
+    doctors = _existing_ids(db, Doctor, {r["doctor_id"] for _, r in batch if r["doctor_id"] is not None})
+    ok = []
+    for n, r in batch:
+        if r["patient_id"] not in patients:
+            errors.append({"row": n, "error": f"patient {r['patient_id']} not found"})
+        elif r["doctor_id"] is not None and r["doctor_id"] not in doctors:
+            errors.append({"row": n, "error": f"doctor {r['doctor_id']} not found"})
+        else:
+            ok.append((n, r))
+    return ok
+
+KINDS = {
+    "patients": (Patient, clean_patient, None, None),
+    "doctors": (Doctor, clean_doctor, None, None),
+    "appointments": (Appointment, clean_appointment, check_appointment_fks, analytics.record),
+}
+
+def bulk_import(session_factory, kind, rows, batch_size=1000):
+    """Validate rows and insert them in batched transactions (executemany with RETURNING).
+
+    Invalid rows are skipped and reported. Returns {"inserted", "ids", "rows", "errors"}: ids in input
+    order, and rows mapping each input row number to its new id.
+    """
+    model, clean, check, after_insert = KINDS[kind]
+    created, errors, batch = [], [], []  # created: (row number, id)
+
+    def flush():
+        if not batch:
+            return
+        with session_factory() as db:
+            good = check(db, batch, errors) if check else list(batch)
+            if good:
+                # Appointment rows may or may not carry date_time; group by key set so each executemany is uniform
+                groups = {}
+                for n, r in good:
+                    groups.setdefault(tuple(sorted(r)), []).append((n, r))
+                try:
+                    inserted = []
+                    for group in groups.values():
+                        inserted.extend(zip((n for n, _ in group), db.scalars(
+                            insert(model).returning(model.id, sort_by_parameter_order=True),
+                            [r for _, r in group],
+                        ).all()))
+                    if after_insert:
+                        after_insert(db, [i for _, i in inserted])  # same transaction, e.g. analytics rollups
+                    bump_versions(db, kind)
+                    db.commit()
+                    created.extend(sorted(inserted))  # groups reorder rows; ids follow the input
+                except Exception as e:
+                    db.rollback()
+                    errors.extend({"row": n, "error": f"batch failed: {e.__class__.__name__}"} for n, _ in good)
+        batch.clear()
+
+    rows, n = iter(rows), 0
+    while True:
+        try:
+            n, row = next(rows)
+        except StopIteration:
+            break
+        except (ValueError, csv.Error) as e:
+            # undecodable/garbled body: earlier batches may be committed already, so report
+            # where reading stopped alongside the ids instead of failing the whole request
+            errors.append({"row": n + 1, "error": f"unreadable body, import stopped: {e}"})
+            break
+        try:
+            if isinstance(row, Exception):
+                raise row
+            if not isinstance(row, dict):
+                raise ValueError("expected an object")
+            batch.append((n, clean(row)))
+        except ValueError as e:
+            errors.append({"row": n, "error": str(e)})
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    errors.sort(key=lambda e: e["row"])
+    return {"inserted": len(created), "ids": [i for _, i in created],
+            "rows": [{"row": n, "id": i} for n, i in created], "errors": errors}
@@ -1,8 +1,79 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
+from metrics import instrument_engine
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///hospital.sqlite3")
-connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
-engine = create_engine(DATABASE_URL, connect_args=connect_args, echo=False, future=True)
+
+def _env_int(name, default):
+    v = os.getenv(name, str(default))
+    try:
+        return int(v)
+    except ValueError:
+        raise RuntimeError(f"{name} must be an integer, got {v!r}")
+
+def _sqlite_profile(url):
+    """WAL + relaxed fsync so readers in other Gunicorn workers never block on a writer."""
+    journal = os.getenv("SQLITE_JOURNAL_MODE", "WAL").upper()
+    sync = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+    if journal not in {"WAL", "DELETE", "TRUNCATE", "PERSIST", "MEMORY", "OFF"}:
+        raise RuntimeError(f"SQLITE_JOURNAL_MODE {journal!r} is not a SQLite journal mode")
+    if sync not in {"OFF", "NORMAL", "FULL", "EXTRA"}:
+        raise RuntimeError(f"SQLITE_SYNCHRONOUS {sync!r} is not a SQLite synchronous level")
+    memory = url.database in (None, "", ":memory:")
+    pragmas = [
+        ("journal_mode", "MEMORY" if memory else journal),
+        ("synchronous", sync),
+        ("busy_timeout", _env_int("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+        ("mmap_size", _env_int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+        ("cache_size", _env_int("SQLITE_CACHE_SIZE", -64 * 1024)),  # negative = KiB
+        ("temp_store", "MEMORY"),
+    ]
+    # one pooled connection per request thread (gthread workers)
+    return {"connect_args": {"check_same_thread": False},
+            "pool_size": _env_int("DB_POOL_SIZE", max(5, _env_int("WEB_THREADS", 8)))}, pragmas
+
+def _server_profile():
+    return {
+        "pool_size": _env_int("DB_POOL_SIZE", max(5, _env_int("WEB_THREADS", 8))),
+        "max_overflow": _env_int("DB_MAX_OVERFLOW", 10),
+        "pool_timeout": _env_int("DB_POOL_TIMEOUT", 30),
+        "pool_recycle": _env_int("DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "1") not in ("0", "false", "no"),
+    }, []
+
+def build_engine(database_url):
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite":
+        kwargs, pragmas = _sqlite_profile(url)
+    else:
+        kwargs, pragmas = _server_profile()
+    eng = create_engine(url, echo=False, future=True, **kwargs)
+    if pragmas:
+        @event.listens_for(eng, "connect")
+        def _apply_pragmas(dbapi_conn, _record):
+            cur = dbapi_conn.cursor()
+            for name, value in pragmas:
+                cur.execute(f"PRAGMA {name}={value}")
+            cur.close()
+    return eng
+
+def check_engine():
+    """Fail fast at startup: open a connection and confirm the settings actually took effect."""
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            if engine.dialect.name == "sqlite" and engine.url.database not in (None, "", ":memory:"):
+                want = os.getenv("SQLITE_JOURNAL_MODE", "WAL").lower()
+                got = conn.execute(text("PRAGMA journal_mode")).scalar()
+                if got.lower() != want:
+                    raise RuntimeError(f"SQLite journal_mode is {got!r}, expected {want!r}")
+    except RuntimeError:
+        raise
+    except Exception as e:
+        raise RuntimeError(f"cannot connect to DATABASE_URL ({engine.url.render_as_string(hide_password=True)}): {e}") from e
+
+engine = build_engine(DATABASE_URL)
+instrument_engine(engine)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
 Base = declarative_base()
@@ -0,0 +1,37 @@
+# Picked up automatically by `gunicorn app:app` when started from this directory.
+# Command-line flags (-w, -b, -k, --threads) still override these.
+import os, sys
+
+_cores = os.cpu_count() or 1
+
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '8000')}")
+# gthread: every worker serves WEB_THREADS requests at once, so a slow S3 call or query only
+# holds one thread. "gevent" (pip install gevent) suits Postgres + S3 deployments; "sync" is the old mode.
+worker_class = os.getenv("WEB_WORKER_CLASS", "gthread")
+workers = int(os.getenv("WEB_CONCURRENCY", str(_cores)))
+threads = int(os.getenv("WEB_THREADS", "8"))
+worker_connections = int(os.getenv("WEB_WORKER_CONNECTIONS", "1000"))  # gevent only
+timeout = int(os.getenv("WEB_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("WEB_KEEPALIVE", "5"))
+# import the app once in the master so workers share its pages and modules copy-on-write;
+# gevent must monkey-patch before the app is imported, so it boots each worker itself
+preload_app = os.getenv("WEB_PRELOAD", "0" if worker_class == "gevent" else "1") not in ("0", "false", "no")
+
+def post_fork(server, worker):
+    # the master's startup check left pooled DB connections behind; never share them across processes
+    if "db" in sys.modules:
+        sys.modules["db"].engine.dispose(close=False)
+    # psycopg2 blocks the gevent hub unless it is told to yield on socket waits
+    if server.cfg.worker_class_str == "gevent":
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            return
+        patch_psycopg()
+
+def child_exit(server, worker):
+    # drop live-gauge files of dead workers when Prometheus multiprocess mode is on
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
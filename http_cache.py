@@ -0,0 +1,47 @@
+import hashlib, threading
+from collections import OrderedDict
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from models import TableVersion
+
+def ensure_versions(db, names):
+    have = {n for (n,) in db.query(TableVersion.name).filter(TableVersion.name.in_(names))}
+    for n in set(names) - have:
+        db.add(TableVersion(name=n, version=0))
+    try:
+        db.commit()
+    except IntegrityError:  # another worker seeded them first
+        db.rollback()
+
+def bump_versions(db, *names):
+    """Invalidate cached GETs for these tables; call before the write's commit so both land together."""
+    db.execute(update(TableVersion).where(TableVersion.name.in_(names))
+               .values(version=TableVersion.version + 1))
+
+def table_version(db, name):
+    return db.query(TableVersion.version).filter(TableVersion.name == name).scalar() or 0
+
+def make_etag(*parts):
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode()).hexdigest()[:32]
+
+class ResponseCache:
+    """Bounded LRU of ETag -> response body. ETags embed the table version, so entries never go stale."""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, etag):
+        with self._lock:
+            body = self._data.get(etag)
+            if body is not None:
+                self._data.move_to_end(etag)
+            return body
+
+    def put(self, etag, body):
+        with self._lock:
+            self._data[etag] = body
+            self._data.move_to_end(etag)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
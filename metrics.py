@@ -0,0 +1,90 @@
+import os, time
+from contextlib import contextmanager
+from sqlalchemy import event
+from prometheus_client import (Counter, Histogram, CollectorRegistry, CONTENT_TYPE_LATEST,
+                               REGISTRY, generate_latest, multiprocess)
+
+# Under Gunicorn set PROMETHEUS_MULTIPROC_DIR (an empty, writable dir) before start-up:
+# every worker then writes its samples there and /metrics aggregates all of them.
+MULTIPROC = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+_LATENCY = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests", ["method", "route", "status"])
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency", ["method", "route"], buckets=_LATENCY)
+DB_LATENCY = Histogram("db_query_duration_seconds", "SQL statement latency", ["op"], buckets=_LATENCY)
+DB_ERRORS = Counter("db_errors_total", "SQL statements that raised", ["op"])
+STORAGE_LATENCY = Histogram("storage_op_duration_seconds", "Photo storage call latency", ["backend", "op"], buckets=_LATENCY)
+STORAGE_ERRORS = Counter("storage_errors_total", "Photo storage calls that raised", ["backend", "op"])
+IMAGE_ENCODE = Histogram("image_encode_duration_seconds", "Pillow decode + variant encode time per upload",
+                         buckets=(.01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10))
+REQUESTS_REJECTED = Counter("http_requests_rejected_total", "Requests refused by rate limiting or load shedding", ["reason"])
+PHOTO_URL_LOOKUPS = Counter("photo_url_lookups_total", "presigned_get calls (misses are storage presign ops)")
+
+@contextmanager
+def timed(histogram, errors=None, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        if errors is not None:
+            errors.labels(**labels).inc()
+        raise
+    finally:
+        (histogram.labels(**labels) if labels else histogram).observe(time.perf_counter() - start)
+
+def _op(statement):
+    head = statement.lstrip().split(None, 1)
+    return head[0].upper() if head else "OTHER"
+
+def instrument_engine(engine):
+    """Time every SQL statement via engine events (cheap: two perf_counter calls)."""
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, params, context, executemany):
+        conn.info.setdefault("_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, params, context, executemany):
+        DB_LATENCY.labels(op=_op(statement)).observe(time.perf_counter() - conn.info["_query_start"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def _error(ctx):
+        stack = ctx.connection.info.get("_query_start") if ctx.connection is not None else None
+        if stack:
+            stack.pop()
+        DB_ERRORS.labels(op=_op(ctx.statement or "")).inc()
+
+def instrument_app(app):
+    """Count and time every request, labelled by route template to keep cardinality bounded."""
+    from flask import g, request
+
+    def _record(status):
+        if g.get("_metrics_done") or "_metrics_start" not in g:
+            return
+        g._metrics_done = True
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+        HTTP_LATENCY.labels(request.method, route).observe(time.perf_counter() - g._metrics_start)
+        HTTP_REQUESTS.labels(request.method, route, str(status)).inc()
+
+    @app.before_request
+    def _start():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _done(resp):
+        _record(resp.status_code)
+        return resp
+
+    @app.teardown_request
+    def _teardown(exc):
+        if exc is not None:
+            _record(500)
+
+def render():
+    """(body, content type) for /metrics, aggregated across workers when multiprocess mode is on."""
+    if MULTIPROC:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
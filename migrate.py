@@ -0,0 +1,110 @@
+"""Versioned schema migrations. Run once per deploy, before the app servers start:
+
+    python migrate.py            # apply pending migrations
+    python migrate.py --status   # show applied / pending versions
+
+The app itself only checks that the schema is current (one SELECT) and refuses to
+start otherwise, so workers never run DDL. Migrations must be idempotent: a deploy
+that died half-way is finished by running this again. Append new ones; never edit
+an applied one.
+"""
+import sys, logging
+from sqlalchemy import func, inspect, text, DateTime
+from sqlalchemy.exc import IntegrityError
+from db import Base, engine, SessionLocal, check_engine
+from models import SchemaMigration
+from http_cache import ensure_versions
+import search
+import analytics
+
+log = logging.getLogger("migrate")
+
+MIGRATIONS = []  # (version, description, fn(engine)), ascending
+
+def migration(version, description):
+    def deco(fn):
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return deco
+
+# ---------------- Migrations ----------------
+@migration(1, "baseline: core tables, indexes, list version counters, search index")
+def _baseline(eng):
+    # checkfirst everywhere, so databases created by the old create_all-on-import adopt this as-is
+    tables = [Base.metadata.tables[n] for n in (
+        "patients", "doctors", "appointments", "doctor_hours", "appointment_slots",
+        "photo_jobs", "table_versions", "staff_users", "staff_sessions")]
+    Base.metadata.create_all(bind=eng, tables=tables)
+    for t in tables:
+        for ix in t.indexes:
+            ix.create(bind=eng, checkfirst=True)
+    with SessionLocal() as db:
+        ensure_versions(db, ["patients", "doctors", "appointments"])
+    search.install(eng)
+
+@migration(2, "appointment analytics rollups (daily and hourly counts), backfilled")
+def _appointment_rollups(eng):
+    Base.metadata.create_all(bind=eng, tables=[Base.metadata.tables["appt_daily_counts"],
+                                               Base.metadata.tables["appt_hourly_counts"]])
+    analytics.rebuild(eng)
+
+@migration(3, "appointments.end_time, so overlapping bookings can be detected")
+def _appointment_end_time(eng):
+    if "end_time" not in {c["name"] for c in inspect(eng).get_columns("appointments")}:
+        with eng.begin() as conn:
+            conn.execute(text(f"ALTER TABLE appointments ADD COLUMN end_time {DateTime().compile(dialect=eng.dialect)}"))
+
+@migration(4, "index patients.phone for ?phone= lookups")
+def _patient_phone_index(eng):
+    for ix in Base.metadata.tables["patients"].indexes:
+        ix.create(bind=eng, checkfirst=True)
+
+@migration(5, "PostgreSQL search: trigram index on digits-only patient phones")
+def _search_phone_digits(eng):
+    search.install(eng)  # IF NOT EXISTS throughout; SQLite's FTS index is left as-is
+
+# ---------------- Runner ----------------
+HEAD = MIGRATIONS[-1][0]
+
+def current_version():
+    if not inspect(engine).has_table(SchemaMigration.__tablename__):
+        return 0
+    with SessionLocal() as db:
+        return db.query(func.max(SchemaMigration.version)).scalar() or 0
+
+def pending():
+    have = current_version()
+    return [(v, d, fn) for v, d, fn in MIGRATIONS if v > have]
+
+def upgrade():
+    """Apply pending migrations in order; returns the versions applied."""
+    SchemaMigration.__table__.create(bind=engine, checkfirst=True)
+    done = []
+    for version, description, fn in pending():
+        log.info("migration %d: %s", version, description)
+        fn(engine)
+        with SessionLocal() as db:
+            db.add(SchemaMigration(version=version, description=description))
+            try:
+                db.commit()
+            except IntegrityError:  # a concurrent deploy recorded it first
+                db.rollback()
+        done.append(version)
+    return done
+
+def require_current():
+    """Startup guard for the app: fail fast instead of serving against an old schema."""
+    have = current_version()
+    if have < HEAD:
+        raise RuntimeError(f"database schema is at version {have}, app needs {HEAD}: run `python migrate.py`")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    check_engine()
+    if "--status" in sys.argv[1:]:
+        have = current_version()
+        for v, d, _ in MIGRATIONS:
+            print(f"{'applied' if v <= have else 'pending'}  {v:4d}  {d}")
+        sys.exit(0)
+    applied = upgrade()
+    print(f"schema at version {HEAD} ({len(applied)} applied)")
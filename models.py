@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, func
+from sqlalchemy import Column, Integer, String, Date, DateTime, Boolean, ForeignKey, Index, func
 from sqlalchemy.orm import relationship
 from db import Base
 
@@ -6,23 +6,105 @@ class Patient(Base):
     __tablename__ = "patients"
     id = Column(Integer, primary_key=True, index=True)
     full_name = Column(String(200), nullable=False)
-    phone = Column(String(50))
+    phone = Column(String(50), index=True)  # ?phone= lookups on GET /patients
     photo_key = Column(String(300))
 
 class Doctor(Base):
     __tablename__ = "doctors"
     id = Column(Integer, primary_key=True, index=True)
     full_name = Column(String(200), nullable=False)
-    specialty = Column(String(200))
+    specialty = Column(String(200), index=True)
     photo_key = Column(String(300))
 
 class Appointment(Base):
     __tablename__ = "appointments"
     id = Column(Integer, primary_key=True, index=True)
-    patient_id = Column(Integer, ForeignKey("patients.id"), nullable=False)
-    doctor_id = Column(Integer, ForeignKey("doctors.id"))
-    date_time = Column(DateTime, server_default=func.now())
+    patient_id = Column(Integer, ForeignKey("patients.id"), nullable=False, index=True)
+    doctor_id = Column(Integer, ForeignKey("doctors.id"), index=True)
+    date_time = Column(DateTime, server_default=func.now(), index=True)
+    end_time = Column(DateTime)  # set when booked into a schedule slot; NULL = length unknown
     reason = Column(String(500))
 
     patient = relationship("Patient")
     doctor = relationship("Doctor")
+
+    __table_args__ = (
+        # interval lookups: "this doctor's appointments between A and B"
+        Index("ix_appointments_doctor_time", "doctor_id", "date_time"),
+    )
+
+class DoctorHours(Base):
+    """One working window of a doctor's weekly schedule, split into fixed-length slots."""
+    __tablename__ = "doctor_hours"
+    id = Column(Integer, primary_key=True)
+    doctor_id = Column(Integer, ForeignKey("doctors.id"), nullable=False, index=True)
+    weekday = Column(Integer, nullable=False)       # 0 = Monday
+    start_minute = Column(Integer, nullable=False)  # minutes after midnight
+    end_minute = Column(Integer, nullable=False)
+    slot_minutes = Column(Integer, nullable=False, default=30)
+
+class AppointmentSlot(Base):
+    """Booking guard: the primary key makes a (doctor, slot start) pair bookable exactly once."""
+    __tablename__ = "appointment_slots"
+    doctor_id = Column(Integer, ForeignKey("doctors.id"), primary_key=True)
+    slot_start = Column(DateTime, primary_key=True)
+    appointment_id = Column(Integer, ForeignKey("appointments.id"), nullable=False)
+
+class PhotoJob(Base):
+    __tablename__ = "photo_jobs"
+    id = Column(String(32), primary_key=True)
+    kind = Column(String(20), nullable=False)  # "patients" | "doctors"
+    entity_id = Column(Integer, nullable=False)
+    status = Column(String(20), nullable=False, default="queued")  # queued | processing | done | failed
+    photo_key = Column(String(300))
+    error = Column(String(500))
+    created_at = Column(DateTime, server_default=func.now())
+    finished_at = Column(DateTime)
+
+class TableVersion(Base):
+    """Monotonic per-table change counter, bumped in the same transaction as each write (drives list ETags)."""
+    __tablename__ = "table_versions"
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class AppointmentDailyCount(Base):
+    """Appointments per doctor per day (doctor_id 0 = no doctor); kept current by analytics.record."""
+    __tablename__ = "appt_daily_counts"
+    day = Column(Date, primary_key=True)
+    doctor_id = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class AppointmentHourlyCount(Base):
+    """Appointments per doctor per hour of each day, for busiest-hour queries."""
+    __tablename__ = "appt_hourly_counts"
+    day = Column(Date, primary_key=True)
+    hour = Column(Integer, primary_key=True)
+    doctor_id = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class StaffUser(Base):
+    __tablename__ = "staff_users"
+    id = Column(Integer, primary_key=True)
+    email = Column(String(200), nullable=False, unique=True, index=True)  # stored lower-cased
+    password_hash = Column(String(200), nullable=False)
+    is_active = Column(Boolean, nullable=False, default=True)
+    created_at = Column(DateTime, server_default=func.now())
+
+class StaffSession(Base):
+    """An issued login; only the SHA-256 of the bearer token is stored."""
+    __tablename__ = "staff_sessions"
+    id = Column(Integer, primary_key=True)
+    token_hash = Column(String(64), nullable=False, unique=True, index=True)
+    user_id = Column(Integer, ForeignKey("staff_users.id"), index=True)  # NULL: issued via ADMIN_TOKEN
+    created_at = Column(DateTime, server_default=func.now())
+    expires_at = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime)
+
+    user = relationship("StaffUser")
+
+class SchemaMigration(Base):
+    """One row per applied migration in migrate.py."""
+    __tablename__ = "schema_migrations"
+    version = Column(Integer, primary_key=True)
+    description = Column(String(200), nullable=False)
+    applied_at = Column(DateTime, server_default=func.now())
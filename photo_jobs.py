@@ -0,0 +1,126 @@
+import io, os, shutil, threading, multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+# Pillow is imported on first use (codec probe or encode), not when the app boots
+
+# variant name -> bounding box in px, largest first so each one is resized from the previous
+VARIANTS = {"full": 1024, "card": 480, "thumb": 160}
+
+def _has_codec(name):
+    from PIL import features
+    try:
+        return bool(features.check_module(name))
+    except ValueError:  # codec unknown to this Pillow version
+        return False
+
+@lru_cache(maxsize=1)
+def image_formats():
+    """Encodings this Pillow build can produce; jpg always."""
+    fmts = ["jpg"]
+    if _has_codec("webp"):
+        fmts.append("webp")
+    if _has_codec("avif"):
+        fmts.append("avif")
+    else:
+        try:
+            import pillow_avif  # noqa: F401  optional plugin for older Pillow
+            fmts.append("avif")
+        except ImportError:
+            pass
+    return tuple(fmts)
+
+CONTENT_TYPES = {"jpg": "image/jpeg", "webp": "image/webp", "avif": "image/avif"}
+_SAVE_ARGS = {
+    "jpg":  {"format": "JPEG", "quality": 88, "optimize": True, "progressive": True},
+    "webp": {"format": "WEBP", "quality": 80, "method": 4},
+    "avif": {"format": "AVIF", "quality": 60},
+}
+
+def encode_variants(raw: bytes) -> dict:
+    """Decode an upload once and encode every size/format variant (runs in a worker process).
+
+    Returns {"full.jpg": bytes, "card.webp": bytes, ...}.
+    """
+    from PIL import Image
+    img = Image.open(io.BytesIO(raw)).convert("RGB")
+    out = {}
+    for size, px in VARIANTS.items():
+        img = img.copy()
+        img.thumbnail((px, px))
+        for fmt in image_formats():
+            buf = io.BytesIO()
+            img.save(buf, **_SAVE_ARGS[fmt])
+            out[f"{size}.{fmt}"] = buf.getvalue()
+    return out
+
+class QueueFull(Exception):
+    """The pipeline already holds max_pending jobs."""
+
+class PhotoPipeline:
+    """Background stage for photo uploads.
+
+    A small thread pool runs each job (encode, upload, DB update) off the
+    request path; the CPU-bound Pillow work is handed to a process pool so it
+    scales across cores. Pools are created lazily and re-created after a
+    fork, so the pipeline is safe to build before Gunicorn forks workers.
+    Encoder processes are started by a forkserver (spawn where there is none),
+    never forked from a threaded worker that may hold locks or DB connections.
+
+    Uploads wait in `spool_dir` rather than in memory, and at most `max_pending`
+    jobs (0 = unbounded) are queued or running per process.
+    """
+
+    def __init__(self, processes=1, threads=4, max_pending=0, spool_dir=None):
+        self.processes = processes or 1
+        self.threads = threads
+        self.max_pending = max_pending
+        self.spool_dir = spool_dir
+        self.pending = 0
+        self._pid = None
+        self._procs = None
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _ensure(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                self._procs = ProcessPoolExecutor(max_workers=self.processes,
+                                                  mp_context=multiprocessing.get_context(method))
+                self._pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="photo")
+                self._pid = os.getpid()
+
+    def spool_path(self, job_id):
+        return os.path.join(self.spool_dir, f"{job_id}.upload")
+
+    def spool(self, job_id, stream):
+        """Copy an upload to disk for the job; returns its size in bytes."""
+        os.makedirs(self.spool_dir, exist_ok=True)
+        with open(self.spool_path(job_id), "wb") as f:
+            shutil.copyfileobj(stream, f, 1024 * 1024)
+            return f.tell()
+
+    def unspool(self, job_id):
+        try:
+            os.remove(self.spool_path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def submit(self, fn, *args):
+        """Queue fn(*args) on the thread pool; raises QueueFull when max_pending jobs are waiting."""
+        self._ensure()
+        with self._lock:
+            if self.max_pending and self.pending >= self.max_pending:
+                raise QueueFull()
+            self.pending += 1
+        fut = self._pool.submit(fn, *args)
+        fut.add_done_callback(self._done)
+        return fut
+
+    def _done(self, _fut):
+        with self._lock:
+            self.pending -= 1
+
+    def encode(self, raw: bytes) -> dict:
+        self._ensure()
+        return self._procs.submit(encode_variants, raw).result()
@@ -0,0 +1,35 @@
+import gzip, hashlib
+from flask import request, Response
+
+try:
+    import brotli  # optional: enables Content-Encoding: br
+except ImportError:
+    brotli = None
+
+class PrecompressedPage:
+    """An HTML page encoded once and held as identity/gzip/brotli byte buffers.
+
+    `response()` picks the encoding from Accept-Encoding and answers a matching
+    If-None-Match with 304. Each encoding gets its own strong ETag.
+    """
+
+    def __init__(self, html: str, brotli_quality=11):
+        raw = html.encode()
+        self.etag = hashlib.sha256(raw).hexdigest()[:32]
+        self.bodies = {"identity": raw, "gzip": gzip.compress(raw, 9)}
+        if brotli is not None:
+            self.bodies["br"] = brotli.compress(raw, quality=brotli_quality)
+
+    def response(self, cache_control):
+        enc = request.accept_encodings.best_match([e for e in ("br", "gzip") if e in self.bodies]) or "identity"
+        etag = self.etag if enc == "identity" else f"{self.etag}-{enc}"
+        if request.if_none_match.contains(etag):
+            resp = Response(status=304)
+        else:
+            resp = Response(self.bodies[enc], mimetype="text/html")
+            if enc != "identity":
+                resp.headers["Content-Encoding"] = enc
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = cache_control
+        resp.vary.add("Accept-Encoding")
+        return resp
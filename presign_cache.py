@@ -0,0 +1,79 @@
+import time, threading
+from collections import OrderedDict
+from redis_backend import SharedBackend
+
+class PresignCache:
+    """Bounded LRU of photo_key -> presigned URL.
+
+    URLs are reused until `max_age` seconds have passed (a fraction of the
+    presign TTL, so clients never receive a URL that is about to expire).
+    Photo keys are unique per upload, so a new upload never hits a stale entry.
+    An optional Redis URL lets all Gunicorn workers share signatures; while
+    Redis is unreachable every worker signs and caches locally.
+    """
+
+    def __init__(self, maxsize=10000, max_age=3600, shared_url=None):
+        self.maxsize = maxsize
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._shared = None
+        if shared_url:
+            self._shared = SharedBackend(shared_url, "presign cache")
+
+    def get(self, key, sign):
+        now = time.monotonic()
+        with self._lock:
+            hit = self._data.get(key)
+            if hit and hit[1] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return hit[0]
+        url, age = self._shared_get(key)
+        if url is None:
+            with self._lock:
+                self.misses += 1
+            url = sign(key)
+            self._shared_set(key, url)
+        else:
+            with self._lock:
+                self.hits += 1
+        self.put(key, url, now, age)
+        return url
+
+    def put(self, key, url, now=None, age=None):
+        expires = (now if now is not None else time.monotonic()) + (age if age is not None else self.max_age)
+        with self._lock:
+            self._data[key] = (url, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+        if self._shared:
+            self._shared.call(lambda r: r.delete(f"presign:{key}"))
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+    def _shared_get(self, key):
+        """Return (url, seconds left) from the shared backend, or (None, None)."""
+        if not self._shared:
+            return None, None
+        def fetch(r):
+            pipe = r.pipeline()
+            pipe.get(f"presign:{key}"); pipe.pttl(f"presign:{key}")
+            return pipe.execute()
+        v, pttl = self._shared.call(fetch, default=(None, None))
+        if not v or pttl is None or pttl <= 0:
+            return None, None
+        return v.decode(), pttl / 1000.0
+
+    def _shared_set(self, key, url):
+        if self._shared:
+            self._shared.call(lambda r: r.setex(f"presign:{key}", max(1, int(self.max_age)), url))
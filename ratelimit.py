@@ -0,0 +1,101 @@
+import time, threading
+from collections import OrderedDict
+from redis_backend import SharedBackend
+
+def parse_rule(spec):
+    """"20/s", "300/m,600" or "5/h,10" -> (tokens per second, burst); "" or "off" -> None.
+
+    The burst (bucket size) defaults to the per-period count.
+    """
+    spec = (spec or "").strip().lower()
+    if spec in ("", "0", "off", "none"):
+        return None
+    rate, _, burst = spec.partition(",")
+    count, _, period = rate.partition("/")
+    seconds = {"s": 1, "sec": 1, "m": 60, "min": 60, "h": 3600, "hour": 3600}.get(period.strip() or "s")
+    try:
+        count = float(count)
+        burst = float(burst) if burst.strip() else count
+    except ValueError:
+        seconds = None
+    if not seconds or count <= 0 or burst < 1:
+        raise RuntimeError(f"bad rate limit {spec!r} (expected e.g. '20/s', '300/m,600')")
+    return count / seconds, burst
+
+# Atomic token bucket in Redis: KEYS[1] = bucket, ARGV = rate, burst, now, cost.
+# Returns the seconds to wait (0 = allowed). Idle buckets expire once they would be full again.
+_LUA = """
+local rate, burst, now, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local b = redis.call('HMGET', KEYS[1], 't', 'ts')
+local t, ts = tonumber(b[1]) or burst, tonumber(b[2]) or now
+t = math.min(burst, t + math.max(0, now - ts) * rate)
+local wait = 0
+if t >= cost then t = t - cost else wait = (cost - t) / rate end
+redis.call('HSET', KEYS[1], 't', t, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+class RateLimiter:
+    """Token buckets keyed by (rule, client).
+
+    Buckets live in a bounded in-process LRU, so limits are per worker. With a
+    Redis URL they are shared by every worker and host instead; if Redis is
+    unreachable the limiter falls back to the local buckets rather than
+    failing requests.
+    """
+
+    def __init__(self, rules, maxsize=100000, shared_url=None):
+        self.rules = {name: rule for name, rule in rules.items() if rule}  # name -> (rate, burst)
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()  # (rule, key) -> [tokens, last monotonic]
+        self._lock = threading.Lock()
+        self._shared = self._script = None
+        if shared_url:
+            self._shared = SharedBackend(shared_url, "rate limit")
+            self._script = self._shared.client.register_script(_LUA)
+
+    def hit(self, rule, key, cost=1):
+        """Take `cost` tokens; returns 0 if allowed, else seconds until it would be."""
+        rate_burst = self.rules.get(rule)
+        if rate_burst is None:
+            return 0
+        if self._shared is not None:
+            wait = self._shared.call(lambda r: float(self._script(
+                keys=[f"rl:{rule}:{key}"], args=[*rate_burst, time.time(), cost], client=r)))
+            if wait is not None:
+                return wait
+        return self._local_hit(rule, key, cost, *rate_burst)
+
+    def _local_hit(self, rule, key, cost, rate, burst):
+        now = time.monotonic()
+        with self._lock:
+            b = self._buckets.get((rule, key))
+            if b is None:
+                b = self._buckets[(rule, key)] = [burst, now]
+                while len(self._buckets) > self.maxsize:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end((rule, key))
+            b[0] = min(burst, b[0] + (now - b[1]) * rate)
+            b[1] = now
+            if b[0] >= cost:
+                b[0] -= cost
+                return 0
+            return (cost - b[0]) / rate
+
+class InFlight:
+    """Requests currently being served by this worker (for load shedding)."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def enter(self):
+        with self._lock:
+            self.count += 1
+            return self.count
+
+    def leave(self):
+        with self._lock:
+            self.count -= 1
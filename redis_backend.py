@@ -0,0 +1,30 @@
+import time, logging
+
+log = logging.getLogger(__name__)
+
+class SharedBackend:
+    """Optional Redis connection shared by every worker, for state that also has a local fallback.
+
+    Commands time out after `timeout` seconds; after a failure the backend is
+    skipped for `backoff` seconds, so an outage costs one timeout per few
+    seconds instead of one per request. Callers get `default` and use their
+    in-process copy meanwhile.
+    """
+
+    def __init__(self, url, name, timeout=0.25, backoff=5):
+        import redis  # optional dependency, only needed for the shared backend
+        self.client = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        self.name = name
+        self.backoff = backoff
+        self._retry_at = 0.0
+
+    def call(self, fn, default=None):
+        """Return fn(client), or `default` if Redis is failing or backing off."""
+        if time.monotonic() < self._retry_at:
+            return default
+        try:
+            return fn(self.client)
+        except Exception as e:
+            self._retry_at = time.monotonic() + self.backoff
+            log.warning("%s: shared backend unavailable, using local state: %s", self.name, e)
+            return default
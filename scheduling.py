@@ -0,0 +1,141 @@
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from models import Appointment, AppointmentSlot, Doctor, DoctorHours
+
+MAX_RANGE_DAYS = 31
+MAX_SLOT_MINUTES = 240     # also bounds how far back an overlapping booking can start
+DEFAULT_SLOT_MINUTES = 30  # assumed length of appointments booked off any schedule
+
+class SlotTaken(Exception):
+    pass
+
+def _minutes(hhmm):
+    try:
+        h, m = (int(p) for p in str(hhmm).split(":"))
+    except ValueError:
+        h = m = -1
+    v = h * 60 + m
+    if not (0 <= h <= 24 and 0 <= m <= 59 and v <= 24 * 60):
+        raise ValueError(f"invalid time {hhmm!r}, expected HH:MM between 00:00 and 24:00")
+    return v
+
+def _hhmm(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def parse_hours(items):
+    """Validate a weekly schedule payload: [{"weekday", "start": "HH:MM", "end": "HH:MM", "slot_minutes"}]."""
+    if not isinstance(items, list):
+        raise ValueError("expected a list of working windows")
+    out = []
+    for it in items:
+        if not isinstance(it, dict):
+            raise ValueError("each working window must be an object")
+        try:
+            weekday, slot = int(it.get("weekday")), int(it.get("slot_minutes", 30))
+        except (TypeError, ValueError):
+            raise ValueError("weekday and slot_minutes must be integers")
+        start, end = _minutes(it.get("start")), _minutes(it.get("end"))
+        if not 0 <= weekday <= 6:
+            raise ValueError("weekday must be 0 (Monday) to 6 (Sunday)")
+        if not 0 < slot <= MAX_SLOT_MINUTES:
+            raise ValueError(f"slot_minutes must be 1 to {MAX_SLOT_MINUTES}")
+        if start + slot > end:
+            raise ValueError("each window must fit at least one slot")
+        out.append({"weekday": weekday, "start_minute": start, "end_minute": end, "slot_minutes": slot})
+    out.sort(key=lambda w: (w["weekday"], w["start_minute"]))
+    for prev, cur in zip(out, out[1:]):
+        if prev["weekday"] == cur["weekday"] and cur["start_minute"] < prev["end_minute"]:
+            raise ValueError(f"working windows overlap on weekday {cur['weekday']}")
+    return out
+
+def hours_json(h):
+    return {"weekday": h.weekday, "start": _hhmm(h.start_minute), "end": _hhmm(h.end_minute),
+            "slot_minutes": h.slot_minutes}
+
+def _slots_for_day(day, hours):
+    for h in hours:
+        if h.weekday != day.weekday():
+            continue
+        m = h.start_minute
+        while m + h.slot_minutes <= h.end_minute:
+            start = datetime(day.year, day.month, day.day) + timedelta(minutes=m)
+            yield start, start + timedelta(minutes=h.slot_minutes)
+            m += h.slot_minutes
+
+def _covering_window(dt, hours):
+    m = dt.hour * 60 + dt.minute
+    for h in hours:
+        if h.weekday == dt.weekday() and h.start_minute <= m < h.end_minute:
+            return h
+    return None
+
+def _booked(db, doctor_id, start, end, hours):
+    """[(start, end)] of this doctor's appointments overlapping [start, end).
+
+    One range scan on ix_appointments_doctor_time, reaching back MAX_SLOT_MINUTES for
+    bookings that began earlier. Appointments without an end_time (bulk imports, older
+    rows) last one slot of the window they fall in, or DEFAULT_SLOT_MINUTES.
+    """
+    out = []
+    for s, e in db.query(Appointment.date_time, Appointment.end_time).filter(
+            Appointment.doctor_id == doctor_id,
+            Appointment.date_time > start - timedelta(minutes=MAX_SLOT_MINUTES),
+            Appointment.date_time < end):
+        if e is None:
+            w = _covering_window(s, hours)
+            e = s + timedelta(minutes=w.slot_minutes if w else DEFAULT_SLOT_MINUTES)
+        if e > start:
+            out.append((s, e))
+    return out
+
+def _overlaps(s, e, booked):
+    return any(bs < e and s < be for bs, be in booked)
+
+def availability(db, doctor_id, start, end, now=None):
+    """Free slots in [start, end), sorted: the schedule's grid minus anything overlapping a booking."""
+    if end <= start:
+        raise ValueError("to must be after from")
+    if end - start > timedelta(days=MAX_RANGE_DAYS):
+        raise ValueError(f"range is limited to {MAX_RANGE_DAYS} days")
+    hours = db.query(DoctorHours).filter(DoctorHours.doctor_id == doctor_id).all()
+    booked = _booked(db, doctor_id, start, end, hours)
+    now = now or datetime.utcnow()
+    free, day = {}, start.date()
+    while day <= end.date():
+        for s, e in _slots_for_day(day, hours):
+            if start <= s < end and s >= now and not _overlaps(s, e, booked):
+                free[s] = e
+        day += timedelta(days=1)
+    return [{"start": s.isoformat(), "end": e.isoformat()} for s, e in sorted(free.items())]
+
+def on_grid(dt, hours):
+    if dt.second or dt.microsecond:
+        return False
+    m = dt.hour * 60 + dt.minute
+    return any(h.weekday == dt.weekday() and h.start_minute <= m
+               and m + h.slot_minutes <= h.end_minute
+               and (m - h.start_minute) % h.slot_minutes == 0 for h in hours)
+
+def reserve_slot(db, appt):
+    """Claim [date_time, date_time + slot) for appt's doctor inside the caller's transaction.
+
+    Raises ValueError if the time is off the doctor's schedule and SlotTaken if it overlaps
+    another booking. Must run before anything else in the transaction: it starts by writing
+    the doctor's row, which serializes bookings per doctor (a row lock on PostgreSQL, the
+    write lock on SQLite), so the overlap check sees every committed booking.
+    """
+    db.execute(update(Doctor).where(Doctor.id == appt.doctor_id).values(id=Doctor.id))
+    hours = db.query(DoctorHours).filter(DoctorHours.doctor_id == appt.doctor_id).all()
+    if hours and not on_grid(appt.date_time, hours):
+        raise ValueError("date_time is not a bookable slot for this doctor")
+    w = _covering_window(appt.date_time, hours)
+    appt.end_time = appt.date_time + timedelta(minutes=w.slot_minutes if w else DEFAULT_SLOT_MINUTES)
+    if _overlaps(appt.date_time, appt.end_time, _booked(db, appt.doctor_id, appt.date_time, appt.end_time, hours)):
+        raise SlotTaken()
+    try:
+        db.flush()
+        db.add(AppointmentSlot(doctor_id=appt.doctor_id, slot_start=appt.date_time, appointment_id=appt.id))
+        db.flush()
+    except IntegrityError:
+        raise SlotTaken()
@@ -0,0 +1,156 @@
+# Name/phone/specialty search over patients and doctors.
+# On SQLite this is an FTS5 index (search_fts) kept in sync by triggers, so every write
+# path (single creates, bulk imports, raw SQL) updates it. Rowids encode the source row:
+# patient id*2, doctor id*2+1. Phones are indexed digits-only. Other databases fall back
+# to ILIKE matching with the same semantics (every word a prefix of some word, AND; phones
+# compared digits-only) and a weighted score in place of bm25; on PostgreSQL trigram GIN
+# indexes keep those scans indexed.
+import re, logging
+from sqlalchemy import text, or_, and_, func, case, literal, literal_column
+from models import Patient, Doctor
+
+log = logging.getLogger(__name__)
+
+def _digits(col):
+    expr = f"coalesce({col}, '')"
+    for ch in (" ", "-", "+", "(", ")", "."):
+        expr = f"replace({expr}, '{ch}', '')"
+    return expr
+
+_SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5("
+    "full_name, phone, specialty, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+] + [
+    stmt
+    for table, rowid, cols in (
+        ("patients", "{r}.id*2", f"{{r}}.full_name, {_digits('{r}.phone')}, NULL"),
+        ("doctors", "{r}.id*2+1", "{r}.full_name, NULL, {r}.specialty"),
+    )
+    for stmt in (
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO search_fts(rowid, full_name, phone, specialty) VALUES ({rowid.format(r='new')}, {cols.format(r='new')}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_ad AFTER DELETE ON {table} BEGIN "
+        f"DELETE FROM search_fts WHERE rowid = {rowid.format(r='old')}; END",
+        # only the indexed columns; photo_key updates leave the index alone
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_au AFTER UPDATE OF full_name, "
+        f"{'phone' if table == 'patients' else 'specialty'} ON {table} BEGIN "
+        f"DELETE FROM search_fts WHERE rowid = {rowid.format(r='old')}; "
+        f"INSERT INTO search_fts(rowid, full_name, phone, specialty) VALUES ({rowid.format(r='new')}, {cols.format(r='new')}); END",
+    )
+]
+
+def install(engine):
+    """Create the index and its triggers if needed; backfill when the index is new."""
+    if engine.dialect.name == "sqlite":
+        with engine.begin() as conn:
+            fresh = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE name = 'search_fts'")).first() is None
+            for stmt in _SQLITE_DDL:
+                conn.execute(text(stmt))
+        if fresh:
+            rebuild(engine)
+    elif engine.dialect.name == "postgresql":
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                for table, col in (("patients", "full_name"), ("doctors", "full_name"), ("doctors", "specialty")):
+                    conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_{col}_trgm "
+                                      f"ON {table} USING gin ({col} gin_trgm_ops)"))
+                conn.execute(text("DROP INDEX IF EXISTS ix_patients_phone_trgm"))  # raw phones are never searched
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_patients_phone_digits_trgm "
+                                  f"ON patients USING gin (({_digits('phone')}) gin_trgm_ops)"))
+        except Exception as e:
+            log.warning("search: trigram indexes unavailable, falling back to unindexed ILIKE: %s", e)
+
+def rebuild(engine):
+    """Repopulate search_fts from the base tables (idempotent; one transaction)."""
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM search_fts"))
+        conn.execute(text(
+            "INSERT INTO search_fts(rowid, full_name, phone, specialty) "
+            f"SELECT id*2, full_name, {_digits('phone')}, NULL FROM patients"))
+        conn.execute(text(
+            "INSERT INTO search_fts(rowid, full_name, phone, specialty) "
+            "SELECT id*2+1, full_name, NULL, specialty FROM doctors"))
+
+def fts_query(q):
+    """User text -> FTS5 MATCH expression: every word as a quoted prefix term (AND).
+
+    A query made only of digits/punctuation is treated as one phone-number prefix.
+    """
+    words = re.findall(r"\w+", q)
+    if not words:
+        return None
+    if all(w.isdigit() for w in words):
+        return f'phone : "{"".join(words)}"*'
+    return " ".join(f'"{w}"*' for w in words)
+
+def search(db, q, kinds, limit, offset):
+    """Return ([(kind, id)], has_more) ranked best-first."""
+    if db.bind.dialect.name == "sqlite":
+        return _search_fts(db, q, kinds, limit, offset)
+    return _search_like(db, q, kinds, limit, offset)
+
+def _search_fts(db, q, kinds, limit, offset):
+    match = fts_query(q)
+    if match is None:
+        return [], False
+    where = ""
+    if kinds == {"patient"}:
+        where = " AND rowid % 2 = 0"
+    elif kinds == {"doctor"}:
+        where = " AND rowid % 2 = 1"
+    rows = db.execute(text(
+        "SELECT rowid FROM search_fts WHERE search_fts MATCH :m" + where +
+        " ORDER BY bm25(search_fts, 10.0, 5.0, 2.0) LIMIT :lim OFFSET :off"),
+        {"m": match, "lim": limit + 1, "off": offset}).scalars().all()
+    hits = [("doctor" if r % 2 else "patient", r // 2) for r in rows]
+    return hits[:limit], len(hits) > limit
+
+# column weights, as in the bm25() call above
+_WEIGHTS = {"full_name": 10, "phone": 5, "specialty": 2}
+
+def _like_escape(w):
+    return w.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _word_prefix(col, w):
+    """col has a word starting with w (case-insensitive; LIKE metacharacters in w are literal)."""
+    w = _like_escape(w)
+    return or_(col.ilike(f"{w}%", escape="\\"), col.ilike(f"% {w}%", escape="\\"))
+
+def _search_like(db, q, kinds, limit, offset):
+    words = re.findall(r"\w+", q)
+    if not words:
+        return [], False
+    phone_only = all(w.isdigit() for w in words)
+    if phone_only:
+        words = ["".join(words)]
+    scored = []
+    for kind, model, cols in (("patient", Patient, ("full_name", "phone")),
+                              ("doctor", Doctor, ("full_name", "specialty"))):
+        if kind not in kinds:
+            continue
+        per_word, score = [], literal(0)
+        for w in words:
+            matches = {}
+            for c in cols:
+                if c == "phone":
+                    if w.isdigit():  # phones compare digits-only, like the FTS index
+                        matches[c] = literal_column(_digits("patients.phone")).like(f"{w}%")
+                elif not phone_only:
+                    matches[c] = _word_prefix(getattr(model, c), w)
+            if not matches:
+                break  # this word cannot match this kind at all
+            per_word.append(or_(*matches.values()))
+            for c, m in matches.items():
+                score = score + case((m, _WEIGHTS[c]), else_=0)
+        else:
+            score = score.label("score")
+            scored += [(-sc, name.lower(), kind, i) for i, name, sc in db.query(model.id, model.full_name, score)
+                       .filter(and_(*per_word))
+                       .order_by(score.desc(), func.lower(model.full_name), model.id)
+                       .limit(offset + limit + 1)]
+    hits = [(kind, i) for _, _, kind, i in sorted(scored)][offset:offset + limit + 1]
+    return hits[:limit], len(hits) > limit
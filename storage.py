@@ -0,0 +1,97 @@
+import os, time, hmac, hashlib, tempfile, threading
+from werkzeug.security import safe_join
+
+class S3Storage:
+    """Photos in an S3 bucket, served through presigned GET URLs."""
+
+    def __init__(self, bucket, region, max_connections=10):
+        self.bucket = bucket
+        self.region = region
+        self.max_connections = max_connections
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        # boto3 is imported and the client built on first use, in the worker that uses it:
+        # boots stay fast and no HTTP connection pool is ever inherited across a fork
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import boto3
+                    from botocore.config import Config
+                    # thread-safe; sized so request and photo threads do not queue behind each
+                    # other, with timeouts bounding how long a slow S3 can hold one
+                    self._client = boto3.session.Session().client("s3", region_name=self.region, config=Config(
+                        max_pool_connections=self.max_connections, connect_timeout=5, read_timeout=30,
+                        retries={"max_attempts": 3, "mode": "adaptive"},
+                    ))
+        return self._client
+
+    def put(self, key, body, content_type):
+        self.client.put_object(
+            Bucket=self.bucket, Key=key, Body=body,
+            ContentType=content_type, CacheControl="max-age=31536000, public"
+        )
+
+    def url(self, key, ttl):
+        if not self.bucket:
+            return None
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": key},
+            ExpiresIn=ttl
+        )
+
+class LocalStorage:
+    """Photos on local disk under <root>/<kind>/<id>/..., served by the app's /media route.
+
+    URLs carry an expiry and an HMAC signature, mirroring S3 presigned URLs.
+    """
+
+    def __init__(self, root, secret, url_prefix="/media"):
+        if not secret:
+            raise RuntimeError("local storage needs MEDIA_SIGNING_KEY (or ADMIN_TOKEN) to sign URLs")
+        self.root = os.path.abspath(root)
+        self.secret = secret.encode()
+        self.url_prefix = url_prefix
+
+    def path(self, key):
+        p = safe_join(self.root, key)
+        if p is None:
+            raise ValueError("invalid key")
+        return p
+
+    def put(self, key, body, content_type):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write-then-rename so readers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".upload-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(body)
+        os.replace(tmp, path)
+
+    def url(self, key, ttl):
+        exp = int(time.time()) + ttl
+        return f"{self.url_prefix}/{key}?exp={exp}&sig={self._sign(key, exp)}"
+
+    def verify(self, key, exp, sig):
+        """Seconds until the URL expires, or None if it is invalid/expired."""
+        try:
+            exp = int(exp)
+        except (TypeError, ValueError):
+            return None
+        left = exp - int(time.time())
+        if left <= 0 or not hmac.compare_digest(self._sign(key, exp), sig or ""):
+            return None
+        return left
+
+    def _sign(self, key, exp):
+        return hmac.new(self.secret, f"{key}\n{exp}".encode(), hashlib.sha256).hexdigest()
+
+def make_storage(backend, **cfg):
+    if backend == "s3":
+        return S3Storage(cfg["bucket"], cfg["region"], cfg.get("max_connections") or 10)
+    if backend == "local":
+        return LocalStorage(cfg["root"], cfg["secret"])
+    raise RuntimeError(f"unknown STORAGE_BACKEND {backend!r} (expected 's3' or 'local')")
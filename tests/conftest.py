@@ -0,0 +1,30 @@
+import os, sys, tempfile
+import pytest
+
+# app.py reads its configuration at import time, so point it at a throw-away database first
+_tmp = tempfile.mkdtemp(prefix="hospital-tests-")
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{os.path.join(_tmp, 'test.sqlite3')}",
+    STORAGE_BACKEND="local", PHOTO_DIR=os.path.join(_tmp, "photos"), ADMIN_TOKEN="test-token",
+    RATE_LIMIT_PUBLIC="off", RATE_LIMIT_SITE="off", RATE_LIMIT_LOGIN="off", RATE_LIMIT_LOGIN_ACCOUNT="off",
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrate  # noqa: E402
+migrate.upgrade()
+import app as hospital  # noqa: E402
+
+AUTH = {"Authorization": "Bearer test-token"}
+
+@pytest.fixture
+def client():
+    return hospital.app.test_client()
+
+@pytest.fixture
+def make(client):
+    """POST a record through the API and return its JSON."""
+    def _make(path, **body):
+        r = client.post(path, json=body, headers=AUTH)
+        assert r.status_code == 201, r.get_json()
+        return r.get_json()
+    return _make
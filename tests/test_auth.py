@@ -0,0 +1,52 @@
+from conftest import AUTH, hospital
+from models import StaffUser
+
+def _login(client, email, password):
+    return client.post("/login", json={"email": email, "password": password})
+
+def test_deactivated_bootstrap_account_stays_off(client, monkeypatch):
+    monkeypatch.setattr(hospital, "ADMIN_USER", "boot@example.org")
+    monkeypatch.setattr(hospital, "ADMIN_PASS", "bootstrap-pass")
+    assert _login(client, "boot@example.org", "bootstrap-pass").status_code == 200
+    with hospital.SessionLocal() as db:
+        uid = db.query(StaffUser.id).filter(StaffUser.email == "boot@example.org").scalar()
+
+    assert client.delete(f"/staff/{uid}", headers=AUTH).status_code == 200
+    assert _login(client, "boot@example.org", "bootstrap-pass").status_code == 401
+    with hospital.SessionLocal() as db:
+        assert db.get(StaffUser, uid).is_active is False
+
+def _fresh():
+    return hospital.app.test_client()  # no cookie jar carried between steps
+
+def _works(token):
+    return _fresh().get("/search?q=zz", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+
+def _staff_token(make, email):
+    uid = make("/staff", email=email, password="correct-horse")["id"]
+    r = _login(_fresh(), email, "correct-horse")
+    assert r.status_code == 200
+    return uid, r.get_json()["token"]
+
+def test_logout_revokes_the_session(make):
+    _, token = _staff_token(make, "logout@example.org")
+    assert _works(token)
+    _fresh().get("/logout", headers={"Authorization": f"Bearer {token}"})
+    assert not _works(token)
+
+def test_deactivating_staff_revokes_their_sessions(make):
+    uid, token = _staff_token(make, "gone@example.org")
+    _, other = _staff_token(make, "stays@example.org")
+    assert _works(token) and _works(other)
+    assert _fresh().delete(f"/staff/{uid}", headers=AUTH).status_code == 200
+    assert not _works(token) and _works(other)
+    assert _login(_fresh(), "gone@example.org", "correct-horse").status_code == 401
+
+def test_token_login_issues_a_session_not_the_admin_token():
+    r = _fresh().get("/login/token?token=test-token")
+    assert r.status_code == 302
+    cookie = r.headers["Set-Cookie"]
+    session = cookie.split("Authorization=", 1)[1].split(";", 1)[0].strip('"').removeprefix("Bearer ")
+    assert "test-token" not in cookie and session and _works(session)
+    _fresh().get("/logout", headers={"Authorization": f"Bearer {session}"})
+    assert not _works(session) and _works("test-token")  # revoking it leaves ADMIN_TOKEN alone
@@ -0,0 +1,60 @@
+import json
+from datetime import datetime
+from conftest import AUTH, hospital
+from models import Appointment
+
+def _stored(ids):
+    with hospital.SessionLocal() as db:
+        return [db.get(Appointment, i).date_time for i in ids]
+
+def _bulk(client, body, content_type):
+    return client.post("/appointments/bulk", data=body, headers={**AUTH, "Content-Type": content_type})
+
+def test_offsets_match_single_create(client, make):
+    pid = make("/patients", full_name="Offset Patient")["id"]
+    single = make("/appointments", patient_id=pid, date_time="2030-01-07T10:00:00+02:00")
+    assert _stored([single["id"]]) == [datetime(2030, 1, 7, 8, 0)]
+
+    row = {"patient_id": pid, "date_time": "2030-01-07T10:00:00+02:00"}
+    bodies = {
+        "application/json": json.dumps([row]),
+        "application/x-ndjson": json.dumps(row) + "\n",
+        "text/csv": "patient_id,date_time\n%d,2030-01-07T10:00:00+02:00\n" % pid,
+    }
+    for content_type, body in bodies.items():
+        r = _bulk(client, body, content_type)
+        assert r.status_code == 201, (content_type, r.get_json())
+        assert _stored(r.get_json()["ids"]) == [datetime(2030, 1, 7, 8, 0)], content_type
+
+def test_unreadable_csv_reports_committed_rows(client, make, monkeypatch):
+    monkeypatch.setattr(hospital, "BULK_BATCH", 100)
+    body = "full_name,phone\n" + "".join(f"Bulk {i},{i}\n" for i in range(250))
+    r = client.post("/patients/bulk", data=body.encode() + b"\xff\n",
+                    headers={**AUTH, "Content-Type": "text/csv"})
+    out = r.get_json()
+    assert r.status_code == 201
+    assert out["inserted"] == 250 and len(out["ids"]) == 250
+    assert out["errors"] == [{"row": 251, "error": out["errors"][0]["error"]}]
+    assert "unreadable body" in out["errors"][0]["error"]
+
+def test_malformed_csv_is_not_a_server_error(client):
+    # a field over the csv module's size limit raises csv.Error from the reader
+    r = client.post("/patients/bulk", data="full_name,phone\nAnn,1\n%s,2\n" % ("x" * 200_000),
+                    headers={**AUTH, "Content-Type": "text/csv"})
+    out = r.get_json()
+    assert r.status_code == 201 and out["inserted"] == 1
+    assert out["errors"][0]["row"] == 2 and "unreadable body" in out["errors"][0]["error"]
+
+def test_ids_follow_input_rows_with_mixed_keys(client, make):
+    pid = make("/patients", full_name="Mixed Keys")["id"]
+    rows = [{"patient_id": pid, "date_time": "2030-02-01T09:00:00", "reason": "A"},
+            {"patient_id": pid, "reason": "B"},
+            {"patient_id": 10**9, "reason": "missing patient"},
+            {"patient_id": pid, "date_time": "2030-02-01T10:00:00", "reason": "C"}]
+    r = _bulk(client, json.dumps(rows), "application/json")
+    out = r.get_json()
+    assert r.status_code == 201 and [e["row"] for e in out["errors"]] == [3]
+    assert [m["row"] for m in out["rows"]] == [1, 2, 4]
+    assert out["ids"] == [m["id"] for m in out["rows"]]
+    with hospital.SessionLocal() as db:
+        assert [db.get(Appointment, m["id"]).reason for m in out["rows"]] == ["A", "B", "C"]
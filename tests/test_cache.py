@@ -0,0 +1,21 @@
+from conftest import hospital
+from http_cache import bump_versions
+
+def _etag(client, query):
+    r = client.get(f"/appointments?{query}")
+    assert r.status_code == 200, r.get_json()
+    return r.headers["ETag"]
+
+def test_expanded_list_etag_follows_embedded_tables(client, make):
+    pid = make("/patients", full_name="Cache Patient")["id"]
+    did = make("/doctors", full_name="Dr Cache")["id"]
+    make("/appointments", patient_id=pid, doctor_id=did)
+    before = {q: _etag(client, q) for q in ("limit=5", "expand=doctor", "expand=patient,doctor")}
+
+    with hospital.SessionLocal() as db:  # what a finished doctor photo job does
+        bump_versions(db, "doctors"); db.commit()
+    after = {q: _etag(client, q) for q in before}
+
+    assert after["limit=5"] == before["limit=5"]
+    assert after["expand=doctor"] != before["expand=doctor"]
+    assert after["expand=patient,doctor"] != before["expand=patient,doctor"]
@@ -0,0 +1,51 @@
+import os, time
+from urllib.parse import quote
+import pytest
+from conftest import hospital
+
+KEY = "doctors/1/photo-media/full.jpg"
+
+@pytest.fixture(scope="module")
+def signed():
+    hospital.storage.put(KEY, b"\xff\xd8jpeg-bytes", "image/jpeg")
+    hospital.storage.put("doctors/1/photo-media/thumb.jpg", b"\xff\xd8thumb", "image/jpeg")
+    return hospital.storage.url(KEY, 600)
+
+def _query(url):
+    return url.split("?", 1)[1]
+
+def test_valid_signature_serves_the_file(client, signed):
+    r = client.get(signed)
+    assert r.status_code == 200 and r.data == b"\xff\xd8jpeg-bytes"
+    assert r.headers["ETag"]
+
+def test_if_none_match_answers_304(client, signed):
+    etag = client.get(signed).headers["ETag"]
+    r = client.get(signed, headers={"If-None-Match": etag})
+    assert r.status_code == 304 and r.data == b""
+
+def test_wrong_signature_is_403(client, signed):
+    r = client.get(signed[:-4] + ("0000" if not signed.endswith("0000") else "1111"))
+    assert r.status_code == 403
+    assert client.get(f"/media/{KEY}?exp={int(time.time()) + 600}").status_code == 403
+
+def test_expired_url_is_403(client, signed):
+    expired = hospital.storage.url(KEY, -1)
+    assert client.get(expired).status_code == 403
+    # pushing exp forward breaks the signature
+    exp = int(_query(signed).split("&")[0].split("=")[1])
+    assert client.get(signed.replace(f"exp={exp}", f"exp={exp + 3600}")).status_code == 403
+
+def test_signature_for_another_key_is_403(client, signed):
+    assert client.get(f"/media/doctors/1/photo-media/thumb.jpg?{_query(signed)}").status_code == 403
+
+def test_traversal_keys_are_refused(client, signed):
+    secret = os.path.join(os.path.dirname(hospital.storage.root), "outside.txt")
+    with open(secret, "w") as f:
+        f.write("not a photo")
+    for key in ("../outside.txt", "doctors/../../outside.txt"):
+        url = hospital.storage.url(key, 600)  # even a correctly signed traversal key
+        r = client.get(url)
+        assert r.status_code == 404 and b"not a photo" not in r.data, key
+        r = client.get(f"/media/{quote(key, safe='')}?{_query(url)}")
+        assert r.status_code == 404 and b"not a photo" not in r.data, key
@@ -0,0 +1,64 @@
+import io, os, time
+from datetime import datetime, timedelta
+import pytest
+from conftest import AUTH, hospital
+from models import PhotoJob
+from photo_jobs import PhotoPipeline
+
+def test_encoder_processes_are_not_forked():
+    Image = pytest.importorskip("PIL.Image")
+    buf = io.BytesIO()
+    Image.new("RGB", (2000, 1000), "teal").save(buf, format="PNG")
+    pipeline = PhotoPipeline()
+    try:
+        variants = pipeline.encode(buf.getvalue())
+        assert pipeline._procs._mp_context.get_start_method() in ("forkserver", "spawn")
+    finally:
+        pipeline._procs.shutdown()
+        pipeline._pool.shutdown()
+    assert {"full.jpg", "card.jpg", "thumb.jpg"} <= variants.keys()
+    assert Image.open(io.BytesIO(variants["thumb.jpg"])).size == (160, 80)
+
+def _png():
+    Image = pytest.importorskip("PIL.Image")
+    buf = io.BytesIO()
+    Image.new("RGB", (64, 64), "navy").save(buf, format="PNG")
+    return buf.getvalue()
+
+def _upload(client, did, body):
+    return client.post("/doctors/photo", headers=AUTH, content_type="multipart/form-data",
+                       data={"id": str(did), "file": (io.BytesIO(body), "face.png")})
+
+def test_upload_is_spooled_and_processed(client, make):
+    did = make("/doctors", full_name="Dr Photo")["id"]
+    r = _upload(client, did, _png())
+    assert r.status_code == 202, r.get_json()
+    job_id = r.get_json()["job_id"]
+    for _ in range(200):
+        status = client.get(f"/photos/jobs/{job_id}", headers=AUTH).get_json()
+        if status["status"] in ("done", "failed"):
+            break
+        time.sleep(0.05)
+    assert status["status"] == "done", status
+    assert not os.path.exists(hospital.photo_pipeline.spool_path(job_id))
+
+def test_full_queue_answers_503(client, make, monkeypatch):
+    did = make("/doctors", full_name="Dr Busy")["id"]
+    monkeypatch.setattr(hospital.photo_pipeline, "max_pending", 1)
+    monkeypatch.setattr(hospital.photo_pipeline, "pending", 1)
+    r = _upload(client, did, _png())
+    assert r.status_code == 503 and r.headers["Retry-After"]
+
+def test_stale_jobs_are_failed(client, make):
+    did = make("/doctors", full_name="Dr Stale")["id"]
+    old = datetime.utcnow() - timedelta(seconds=hospital.PHOTO_JOB_STALE + 60)
+    with hospital.SessionLocal() as db:
+        db.add_all([PhotoJob(id="a" * 32, kind="doctors", entity_id=did, status="processing", created_at=old),
+                    PhotoJob(id="b" * 32, kind="doctors", entity_id=did, status="queued", created_at=old),
+                    PhotoJob(id="c" * 32, kind="doctors", entity_id=did, status="queued")])
+        db.commit()
+    status = client.get(f"/photos/jobs/{'a' * 32}", headers=AUTH).get_json()
+    assert status["status"] == "failed" and "interrupted" in status["error"]
+    with hospital.SessionLocal() as db:
+        assert db.get(PhotoJob, "b" * 32).status == "failed"
+        assert db.get(PhotoJob, "c" * 32).status == "queued"  # recent: a live worker may still have it
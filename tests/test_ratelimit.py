@@ -0,0 +1,26 @@
+import pytest
+from werkzeug.middleware.proxy_fix import ProxyFix
+from conftest import hospital
+from ratelimit import RateLimiter, parse_rule
+
+@pytest.fixture
+def site_limit(monkeypatch):
+    monkeypatch.setattr(hospital, "limiter", RateLimiter({"site": parse_rule("1/m,3")}))
+
+def _codes(client, n, **kw):
+    return [client.get("/site", **kw).status_code for _ in range(n)]
+
+def test_forwarded_clients_get_separate_buckets(client, site_limit, monkeypatch):
+    monkeypatch.setattr(hospital, "TRUSTED_PROXY_HOPS", 1)
+    monkeypatch.setattr(hospital.app, "wsgi_app", ProxyFix(hospital.app.wsgi_app, x_for=1))
+    a = {"X-Forwarded-For": "203.0.113.10"}
+    b = {"X-Forwarded-For": "198.51.100.20"}
+    assert _codes(client, 4, headers=a) == [200, 200, 200, 429]
+    assert _codes(client, 3, headers=b) == [200, 200, 200]
+    assert client.get("/site", headers=a).status_code == 429
+
+def test_unconfigured_proxy_does_not_share_one_bucket(client, site_limit):
+    # the test client's peer is 127.0.0.1, like Nginx on the same host without TRUSTED_PROXY_HOPS
+    assert _codes(client, 6) == [200] * 6
+    public = {"environ_base": {"REMOTE_ADDR": "93.184.216.34"}}
+    assert _codes(client, 4, **public) == [200, 200, 200, 429]
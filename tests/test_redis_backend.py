@@ -0,0 +1,23 @@
+import time
+import pytest
+from presign_cache import PresignCache
+from ratelimit import RateLimiter
+
+pytest.importorskip("redis")
+DOWN = "redis://127.0.0.1:1/0"  # nothing listens here
+
+def test_presign_cache_falls_back_when_redis_is_down():
+    cache = PresignCache(max_age=60, shared_url=DOWN)
+    signed = []
+    sign = lambda key: signed.append(key) or f"https://signed/{key}"
+    assert cache.get("a.jpg", sign) == "https://signed/a.jpg"
+    assert cache.get("a.jpg", sign) == "https://signed/a.jpg"
+    cache.invalidate("a.jpg")
+    assert signed == ["a.jpg"]
+
+def test_rate_limiter_falls_back_and_backs_off():
+    limiter = RateLimiter({"r": (1.0, 2)}, shared_url=DOWN)
+    t = time.perf_counter()
+    assert [limiter.hit("r", "k") for _ in range(3)][:2] == [0, 0]
+    assert limiter.hit("r", "k") > 0
+    assert time.perf_counter() - t < 1  # one failed connect, then local buckets during the backoff
@@ -0,0 +1,82 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from conftest import AUTH, hospital
+from scheduling import parse_hours
+
+MONDAY = "2030-01-07"
+
+def _schedule(client, did, slot_minutes=30):
+    r = client.put(f"/doctors/{did}/schedule", headers=AUTH, json={"hours": [
+        {"weekday": 0, "start": "09:00", "end": "12:00", "slot_minutes": slot_minutes}]})
+    assert r.status_code == 200, r.get_json()
+
+def _book(client, pid, did, hhmm):
+    return client.post("/appointments", headers=AUTH, json={
+        "patient_id": pid, "doctor_id": did, "date_time": f"{MONDAY}T{hhmm}:00"})
+
+def _free(client, did):
+    r = client.get(f"/doctors/{did}/availability?from={MONDAY}T00:00:00&to={MONDAY}T23:59:00")
+    assert r.status_code == 200, r.get_json()
+    return [s["start"][11:16] for s in r.get_json()["slots"]]
+
+@pytest.fixture
+def people(make):
+    return make("/patients", full_name="Slot Patient")["id"], make("/doctors", full_name="Dr Slot")["id"]
+
+def test_bulk_appointment_blocks_overlapping_slot(client, people):
+    pid, did = people
+    _schedule(client, did)
+    r = client.post("/appointments/bulk", headers={**AUTH, "Content-Type": "application/json"},
+                    data=json.dumps([{"patient_id": pid, "doctor_id": did, "date_time": f"{MONDAY}T09:40:00"}]))
+    assert r.status_code == 201, r.get_json()
+    assert "09:30" not in _free(client, did) and "10:00" not in _free(client, did)
+    assert _book(client, pid, did, "09:30").status_code == 409
+    assert _book(client, pid, did, "10:30").status_code == 201
+
+def test_slot_length_change_keeps_existing_booking(client, people):
+    pid, did = people
+    _schedule(client, did, 30)
+    booked = _book(client, pid, did, "09:00")
+    assert booked.status_code == 201
+    assert booked.get_json()["end_time"] == f"{MONDAY}T09:30:00"
+    _schedule(client, did, 20)
+    assert _book(client, pid, did, "09:20").status_code == 409
+    assert _book(client, pid, did, "09:40").status_code == 201
+    assert _free(client, did)[:2] == ["10:00", "10:20"]
+
+def test_availability_is_sorted(client, people):
+    pid, did = people
+    r = client.put(f"/doctors/{did}/schedule", headers=AUTH, json={"hours": [
+        {"weekday": 0, "start": "14:00", "end": "15:00", "slot_minutes": 30},
+        {"weekday": 0, "start": "09:00", "end": "10:00", "slot_minutes": 30}]})
+    assert r.status_code == 200
+    assert _free(client, did) == ["09:00", "09:30", "14:00", "14:30"]
+
+def test_concurrent_overlapping_bookings_admit_one(people):
+    pid, did = people
+    # no schedule, so each booking lasts DEFAULT_SLOT_MINUTES: these all overlap but claim different slot keys
+    times = ["15:00", "15:10", "15:20", "14:45"] * 3
+    with ThreadPoolExecutor(len(times)) as pool:
+        codes = list(pool.map(lambda t: _book(hospital.app.test_client(), pid, did, t).status_code, times))
+    assert codes.count(201) == 1 and codes.count(409) == len(times) - 1
+
+def test_concurrent_same_slot_admits_one(client, people):
+    pid, did = people
+    _schedule(client, did)
+    with ThreadPoolExecutor(8) as pool:
+        codes = list(pool.map(lambda _: _book(hospital.app.test_client(), pid, did, "10:30").status_code, range(8)))
+    assert codes.count(201) == 1 and codes.count(409) == 7
+
+@pytest.mark.parametrize("bad", ["09:60", "25:00", "24:30", "9", "ab:cd"])
+def test_invalid_times_are_rejected(bad):
+    with pytest.raises(ValueError, match="between 00:00 and 24:00"):
+        parse_hours([{"weekday": 0, "start": bad, "end": "23:00"}])
+
+def test_overlapping_windows_are_rejected():
+    with pytest.raises(ValueError, match="overlap"):
+        parse_hours([{"weekday": 1, "start": "09:00", "end": "12:00"},
+                     {"weekday": 1, "start": "11:00", "end": "13:00"}])
+    assert len(parse_hours([{"weekday": 1, "start": "09:00", "end": "12:00"},
+                            {"weekday": 1, "start": "12:00", "end": "13:00"},
+                            {"weekday": 2, "start": "11:00", "end": "13:00"}])) == 3
@@ -0,0 +1,44 @@
+import pytest
+import search
+from conftest import AUTH, hospital
+
+@pytest.fixture(scope="module")
+def people():
+    client = hospital.app.test_client()
+    def make(path, **body):
+        r = client.post(path, json=body, headers=AUTH)
+        assert r.status_code == 201, r.get_json()
+        return r.get_json()
+    return {
+        "ana": ("patient", make("/patients", full_name="Ana Okafor", phone="+234 815 000 1111")["id"]),
+        "dr_ana": ("doctor", make("/doctors", full_name="Dr Ana Bello", specialty="Cardiology")["id"]),
+        "dr_obi": ("doctor", make("/doctors", full_name="Dr Obi Cardiano", specialty="Neurology")["id"]),
+        "pct": ("patient", make("/patients", full_name="Percy 100%_Real")["id"]),
+    }
+
+def _like(q, kinds=("patient", "doctor")):
+    with hospital.SessionLocal() as db:  # ILIKE fallback, here compiled as lower() LIKE on SQLite
+        return search._search_like(db, q, set(kinds), 50, 0)[0]
+
+def _fts(q):
+    with hospital.SessionLocal() as db:
+        return search._search_fts(db, q, {"patient", "doctor"}, 50, 0)[0]
+
+def test_every_word_must_match(people):
+    assert _like("ana cardio") == [people["dr_ana"]]
+    assert people["dr_obi"] in _like("cardi") and people["dr_ana"] in _like("cardi")
+    assert _like("kaf") == [] and _fts("kaf") == []  # prefixes of words, not substrings
+
+def test_phones_compare_digits_only(people):
+    assert _like("+234 815") == [people["ana"]] == [h for h in _fts("+234 815") if h == people["ana"]]
+    assert people["ana"] in _like("234815000")
+    assert _like("234815", kinds=("doctor",)) == []
+
+def test_ranking_prefers_name_matches(people):
+    # "ana" hits two names; "cardi" hits a specialty (weight 2) and a name (weight 10)
+    assert _like("cardi")[0] == people["dr_obi"]
+
+def test_like_metacharacters_are_literal(people):
+    assert _like("100_") == []
+    assert _like("_") == []
+    assert people["pct"] in _like("percy")
@@ -0,0 +1,15 @@
+from datetime import datetime, timezone
+
+def parse_dt(v, name):
+    """ISO-8601 -> naive UTC datetime (the form stored in date_time).
+
+    Shared by the JSON routes and bulk imports so an offset like +02:00 lands on the
+    same instant whichever way a row is written.
+    """
+    try:
+        dt = datetime.fromisoformat(str(v))
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO-8601 date/time")
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt